@@ -0,0 +1,234 @@
+"""Admission control for expensive endpoints (mailbox creation).
+
+Two independent gates run before the route handler:
+
+- a sliding-window limit per client (API key if sent, otherwise client IP),
+  answered with ``429`` and ``Retry-After`` once a client exceeds its budget;
+- a bounded global queue of in-flight requests: at most ``max_in_flight`` run
+  at once, at most ``max_queue`` wait (for up to ``queue_timeout`` seconds),
+  and everything beyond is shed immediately with ``503`` and ``Retry-After``.
+
+Requests are charged by cost: a plain create costs one against ``limit``; a
+batch create costs the number of mailboxes it asks for against its own
+``batch_limit`` (charged by the handler, which knows the count). Window counters live in a ``WindowStore``: ``InMemoryWindowStore``
+serves a single worker, ``SharedWindowStore`` keeps them in a shared state
+backend (see shared_state) so the budget holds across workers.
+"""
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import deque
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class WindowStore:
+    """Backend interface for sliding-window counters"""
+
+    async def hit(self, key: str, limit: int, window: float, cost: int = 1) -> Tuple[bool, float]:
+        """Charge ``cost`` units to ``key`` if they fit; returns (allowed, retry_after_seconds)"""
+        raise NotImplementedError
+
+
+class InMemoryWindowStore(WindowStore):
+    """Per-process sliding-window log ((timestamp, cost) of accepted requests per key)"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._hits: Dict[str, deque] = {}
+        self._totals: Dict[str, int] = {}
+
+    async def hit(self, key: str, limit: int, window: float, cost: int = 1) -> Tuple[bool, float]:
+        now = time.monotonic()
+        hits = self._hits.get(key)
+        if hits is None:
+            if len(self._hits) >= self.max_keys:
+                self._prune(now, window)
+            hits = self._hits[key] = deque()
+            self._totals[key] = 0
+        while hits and hits[0][0] <= now - window:
+            self._totals[key] -= hits.popleft()[1]
+        if cost > limit:
+            return False, window
+        if self._totals[key] + cost > limit:
+            # Wait until enough of the oldest hits have left the window
+            freed = 0
+            for stamp, spent in hits:
+                freed += spent
+                if self._totals[key] - freed + cost <= limit:
+                    return False, stamp + window - now
+        hits.append((now, cost))
+        self._totals[key] += cost
+        return True, 0.0
+
+    def _prune(self, now: float, window: float):
+        for key in [k for k, hits in self._hits.items() if not hits or hits[-1][0] <= now - window]:
+            del self._hits[key]
+            del self._totals[key]
+
+
+class SharedWindowStore(WindowStore):
+    """Sliding-window estimate over fixed-window counters in a shared StateBackend
+
+    The previous window's count is weighted by how much of it still overlaps
+    the sliding window, which bounds the budget across all workers without
+    keeping a per-request log in the shared store.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._next_purge = 0.0
+
+    async def hit(self, key: str, limit: int, window: float, cost: int = 1) -> Tuple[bool, float]:
+        now = time.time()
+        if cost > limit:
+            return False, window
+        if now >= self._next_purge:
+            self._next_purge = now + window
+            await self.backend.purge_expired()
+        bucket = int(now // window)
+        elapsed = now - bucket * window
+        current_key = f"admission:{key}:{bucket}"
+        previous = await self.backend.incr(f"admission:{key}:{bucket - 1}", 0, ttl=2 * window)
+        current = await self.backend.incr(current_key, cost, ttl=2 * window)
+        if previous * (1 - elapsed / window) + current <= limit:
+            return True, 0.0
+        await self.backend.incr(current_key, -cost, ttl=2 * window)
+        return False, window - elapsed
+
+
+class AdmissionController:
+    """Per-client sliding-window limits plus a bounded global in-flight queue"""
+
+    def __init__(
+        self,
+        store: Optional[WindowStore] = None,
+        limit: int = 10,
+        window: float = 60,
+        batch_limit: Optional[int] = None,
+        max_in_flight: int = 20,
+        max_queue: int = 50,
+        queue_timeout: float = 10,
+        trust_proxy: bool = False,
+    ):
+        self.store = store or InMemoryWindowStore()
+        self.limit = limit
+        self.window = window
+        self.batch_limit = limit if batch_limit is None else batch_limit
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.trust_proxy = trust_proxy
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._in_flight = 0
+        self._waiting = 0
+        self._stats = {"admitted": 0, "rate_limited": 0, "shed": 0, "queue_timeouts": 0, "store_errors": 0}
+
+    def client_key(self, scope) -> str:
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        api_key = headers.get("x-api-key")
+        if api_key:
+            return f"key:{api_key}"
+        if self.trust_proxy and headers.get("x-forwarded-for"):
+            return f"ip:{headers['x-forwarded-for'].split(',')[0].strip()}"
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def check_rate(self, client: str, cost: int = 1, batch: bool = False) -> Tuple[bool, float]:
+        """Charge ``cost`` to the client's create budget (or its separate batch budget)"""
+        key, limit = (f"batch:{client}", self.batch_limit) if batch else (client, self.limit)
+        try:
+            allowed, retry_after = await self.store.hit(key, limit, self.window, cost)
+        except Exception as e:
+            # A broken shared backend must not take creation down with it
+            self._stats["store_errors"] += 1
+            logger.warning(f"⚠️ Admission store error, allowing request: {e}")
+            return True, 0.0
+        if not allowed:
+            self._stats["rate_limited"] += 1
+        return allowed, retry_after
+
+    async def enter(self) -> bool:
+        """Take an in-flight slot, queueing briefly; False means the request was shed"""
+        if self._in_flight < self.max_in_flight and not self._waiting:
+            await self._slots.acquire()
+        elif self._waiting >= self.max_queue:
+            self._stats["shed"] += 1
+            return False
+        else:
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._stats["queue_timeouts"] += 1
+                return False
+            finally:
+                self._waiting -= 1
+        self._in_flight += 1
+        self._stats["admitted"] += 1
+        return True
+
+    def leave(self):
+        self._in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "limit": f"{self.limit}/{self.window:g}s",
+            "batch_limit": f"{self.batch_limit}/{self.window:g}s",
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "store": type(self.store).__name__,
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController to POSTs on the given paths
+
+    ``handler_charged_paths`` only go through the in-flight queue here; their
+    handler charges the per-client window itself once it knows the cost.
+    """
+
+    def __init__(self, app, controller: AdmissionController, paths: Iterable[str], handler_charged_paths: Iterable[str] = ()):
+        self.app = app
+        self.controller = controller
+        self.handler_charged_paths = set(handler_charged_paths)
+        self.paths = set(paths) | self.handler_charged_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["path"] not in self.handler_charged_paths:
+            allowed, retry_after = await self.controller.check_rate(self.controller.client_key(scope))
+            if not allowed:
+                await self._reject(send, 429, retry_after, "Too many create requests, slow down")
+                return
+        if not await self.controller.enter():
+            await self._reject(send, 503, self.controller.queue_timeout, "Server busy creating emails, retry later")
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.leave()
+
+    @staticmethod
+    async def _reject(send, status: int, retry_after: float, detail: str):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
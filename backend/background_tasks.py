@@ -1,9 +1,12 @@
 import asyncio
 import logging
+import os
+import time
 from datetime import datetime, timezone
+from sqlalchemy import select, insert, delete
 from sqlalchemy.orm import Session
 from database import SessionLocal
-from models import TempEmail, EmailHistory
+from models import TempEmail, EmailHistory, LocalMessage
 import httpx
 import random
 import string
@@ -13,6 +16,9 @@ logger = logging.getLogger(__name__)
 # Mail.tm Configuration
 MAILTM_BASE_URL = "https://api.mail.tm"
 
+# Expired rows are archived this many at a time, one transaction per chunk
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", "500"))
+
 
 async def get_available_domains():
     """Get available domains from Mail.tm"""
@@ -115,6 +121,56 @@ async def create_new_email_auto(db: Session):
         return None
 
 
+def archive_expired_emails(db: Session, now: datetime, chunk_size: int = ARCHIVE_CHUNK_SIZE) -> int:
+    """Move expired emails to history in chunks of INSERT ... SELECT + DELETE; returns rows moved"""
+    archived = 0
+    while True:
+        try:
+            # Lock one chunk of expired ids (skipping rows another worker is archiving)
+            ids = db.execute(
+                select(TempEmail.id)
+                .where(TempEmail.expires_at <= now)
+                .order_by(TempEmail.expires_at)
+                .limit(chunk_size)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+            if not ids:
+                db.commit()
+                break
+            
+            db.execute(
+                insert(EmailHistory).from_select(
+                    # History assigns its own ids: delete_email archives rows too, so the ranges overlap
+                    ["address", "password", "token", "account_id", "created_at", "expired_at", "message_count"],
+                    select(
+                        TempEmail.address, TempEmail.password, TempEmail.token,
+                        TempEmail.account_id, TempEmail.created_at, TempEmail.expires_at, TempEmail.message_count
+                    ).where(TempEmail.id.in_(ids))
+                )
+            )
+            db.execute(
+                delete(LocalMessage).where(LocalMessage.mailbox_address.in_(
+                    select(TempEmail.address).where(TempEmail.id.in_(ids), TempEmail.provider == "local")
+                ))
+            )
+            db.execute(delete(TempEmail).where(TempEmail.id.in_(ids)))
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error archiving expired emails: {e}")
+            db.rollback()
+            break
+        
+        archived += len(ids)
+        if len(ids) < chunk_size:
+            break
+    return archived
+
+
+def has_active_emails(db: Session) -> bool:
+    """Cheap existence probe instead of a full COUNT(*)"""
+    return db.execute(select(TempEmail.id).limit(1)).first() is not None
+
+
 async def check_expired_emails():
     """Background task to check and move expired emails to history"""
     while True:
@@ -122,41 +178,15 @@ async def check_expired_emails():
             db = SessionLocal()
             now = datetime.now(timezone.utc)
             
-            # Find all expired emails
-            expired_emails = db.query(TempEmail).filter(TempEmail.expires_at <= now).all()
+            started = time.perf_counter()
+            archived = await asyncio.to_thread(archive_expired_emails, db, now)
             
-            if expired_emails:
-                logger.info(f"Found {len(expired_emails)} expired emails")
-                
-                for email in expired_emails:
-                    try:
-                        # Move to history
-                        history_email = EmailHistory(
-                            id=email.id,
-                            address=email.address,
-                            password=email.password,
-                            token=email.token,
-                            account_id=email.account_id,
-                            created_at=email.created_at,
-                            expired_at=email.expires_at,
-                            message_count=email.message_count
-                        )
-                        
-                        db.add(history_email)
-                        db.delete(email)
-                        db.commit()
-                        
-                        logger.info(f"Moved email to history: {email.address}")
-                        
-                    except Exception as e:
-                        logger.error(f"Error moving email {email.address} to history: {e}")
-                        db.rollback()
-                        continue
+            if archived:
+                logger.info(f"Moved {archived} expired emails to history in {time.perf_counter() - started:.2f}s")
                 
                 # Check if we need to create a new email
                 # Only create if there are no active emails left
-                active_count = db.query(TempEmail).count()
-                if active_count == 0:
+                if not await asyncio.to_thread(has_active_emails, db):
                     logger.info("No active emails, creating new one...")
                     await create_new_email_auto(db)
             
@@ -0,0 +1,170 @@
+"""Per-provider circuit breakers.
+
+CLOSED lets every call through and tracks a sliding failure-rate window.
+Too many failures (or a rate-limit "trip") move the breaker to OPEN, which
+rejects calls for an exponentially growing duration. After that it goes
+HALF_OPEN and admits a limited number of concurrent trial calls: enough
+successes close it again, any failure re-opens it.
+"""
+import logging
+import time
+from collections import deque
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Circuit breaker for a single provider"""
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = 60,
+        min_calls: int = 5,
+        failure_rate_threshold: float = 0.5,
+        open_seconds: float = 60,
+        max_open_seconds: float = 900,
+        half_open_max_calls: int = 1,
+        half_open_successes: int = 2,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.half_open_successes = half_open_successes
+
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.consecutive_opens = 0
+        self._outcomes = deque()  # (timestamp, ok) within window_seconds
+        self._trials_in_flight = 0
+        self._trial_successes = 0
+
+    def _trim(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _refresh_state(self, now: float):
+        if self.state == OPEN and now >= self.open_until:
+            self.state = HALF_OPEN
+            self._trials_in_flight = 0
+            self._trial_successes = 0
+            logger.info(f"🟡 {self.name} circuit half-open (probing)")
+
+    def available(self) -> bool:
+        """Whether a call would currently be admitted (does not reserve a trial slot)"""
+        now = time.time()
+        self._refresh_state(now)
+        if self.state == OPEN:
+            return False
+        if self.state == HALF_OPEN:
+            return self._trials_in_flight < self.half_open_max_calls
+        return True
+
+    def allow(self) -> bool:
+        """Admit a call; in half-open state this reserves one of the trial slots"""
+        if not self.available():
+            return False
+        if self.state == HALF_OPEN:
+            self._trials_in_flight += 1
+        return True
+
+    def release(self):
+        """Give back a trial slot for a call whose outcome is unknown (e.g. cancelled)"""
+        if self.state == HALF_OPEN and self._trials_in_flight > 0:
+            self._trials_in_flight -= 1
+
+    def record_success(self):
+        now = time.time()
+        if self.state == HALF_OPEN:
+            self.release()
+            self._trial_successes += 1
+            if self._trial_successes >= self.half_open_successes:
+                self._close()
+            return
+        self._outcomes.append((now, True))
+        self._trim(now)
+
+    def record_failure(self, trip: bool = False):
+        """Record a failed call; ``trip`` opens the circuit immediately (e.g. HTTP 429)"""
+        now = time.time()
+        if self.state == HALF_OPEN:
+            self.release()
+            self._open(now)
+            return
+        if self.state == OPEN:
+            return
+        self._outcomes.append((now, False))
+        self._trim(now)
+        if trip:
+            self._open(now)
+            return
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate_threshold:
+            self._open(now)
+
+    def _open(self, now: float):
+        duration = min(self.open_seconds * (2 ** self.consecutive_opens), self.max_open_seconds)
+        self.consecutive_opens += 1
+        self.state = OPEN
+        self.open_until = now + duration
+        self._outcomes.clear()
+        logger.warning(f"🔒 {self.name} circuit open for {int(duration)}s")
+
+    def force_open(self, until: float):
+        """Adopt an open state observed elsewhere (e.g. by another worker) until ``until``"""
+        if self.state == OPEN and self.open_until >= until:
+            return
+        self.state = OPEN
+        self.open_until = until
+        self._outcomes.clear()
+        logger.warning(f"🔒 {self.name} circuit open for {int(until - time.time())}s (shared state)")
+
+    def _close(self):
+        self.state = CLOSED
+        self.consecutive_opens = 0
+        self.open_until = 0.0
+        self._outcomes.clear()
+        logger.info(f"🔓 {self.name} circuit closed")
+
+    def remaining_open(self) -> int:
+        return max(0, int(self.open_until - time.time())) if self.state == OPEN else 0
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        self._refresh_state(now)
+        self._trim(now)
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return {
+            "state": self.state,
+            "open_remaining": self.remaining_open(),
+            "consecutive_opens": self.consecutive_opens,
+            "window_calls": len(self._outcomes),
+            "window_failures": failures,
+            "half_open_trials": self._trials_in_flight,
+        }
+
+
+class CircuitBreakerRegistry:
+    """Lazily creates one breaker per provider with shared settings"""
+
+    def __init__(self, **settings):
+        self._settings = settings
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, provider: str) -> CircuitBreaker:
+        breaker = self._breakers.get(provider)
+        if breaker is None:
+            breaker = self._breakers[provider] = CircuitBreaker(provider, **self._settings)
+        return breaker
+
+    def snapshot(self) -> dict:
+        return {provider: breaker.snapshot() for provider, breaker in self._breakers.items()}
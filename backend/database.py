@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 import os
@@ -73,6 +74,7 @@ from urllib.parse import quote_plus
 encoded_password = quote_plus(DB_PASSWORD)
 
 SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{DB_USER}:{encoded_password}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"mysql+aiomysql://{DB_USER}:{encoded_password}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 # Create engine
 engine = create_engine(
@@ -82,9 +84,22 @@ engine = create_engine(
     echo=False
 )
 
-# Create SessionLocal class
+# Async engine for the request handlers and background loops (never blocks the event loop)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    pool_size=int(os.environ.get('DB_POOL_SIZE', '10')),
+    max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', '20')),
+    echo=False
+)
+
+# Create SessionLocal class (sync: schema setup, scripts and worker threads)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Objects stay readable after commit, since they are used after the session closes
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
 # Create Base class
 Base = declarative_base()
 
@@ -95,3 +110,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Dependency to get an async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,116 @@
+"""Stale-while-revalidate cache for provider domain lists.
+
+Fresh entries are served directly, entries close to expiry are refreshed in
+the background, and expired entries are served stale while exactly one
+background task per provider reloads them. Only a cold cache makes a caller
+wait, and concurrent cold callers share the same load.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DomainLoader = Callable[[], Awaitable[List[str]]]
+
+
+class DomainCache:
+    """Per-provider domain cache with background refresh and herd protection"""
+
+    def __init__(self, ttl: float = 300, refresh_ahead: float = 60, refresh_interval: float = 15):
+        self.ttl = ttl
+        self.refresh_ahead = min(refresh_ahead, ttl)
+        self.refresh_interval = refresh_interval
+        self._loaders: Dict[str, DomainLoader] = {}
+        self._entries: Dict[str, dict] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._refresher: Optional[asyncio.Task] = None
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_failures": 0}
+
+    def register(self, provider: str, loader: DomainLoader):
+        """Register the coroutine that loads a provider's domain list"""
+        self._loaders[provider] = loader
+        self._entries.setdefault(provider, {"domains": [], "expires_at": 0})
+
+    async def get(self, provider: str) -> List[str]:
+        """Return the provider's domains, never blocking on a refresh when any entry exists"""
+        entry = self._entries[provider]
+        now = time.time()
+
+        if entry["domains"]:
+            if now < entry["expires_at"]:
+                self._stats["hits"] += 1
+                if now >= entry["expires_at"] - self.refresh_ahead:
+                    self._schedule_refresh(provider)
+            else:
+                self._stats["stale_hits"] += 1
+                self._schedule_refresh(provider)
+            return entry["domains"]
+
+        # Cold cache: wait for the (shared) load
+        self._stats["misses"] += 1
+        await asyncio.shield(self._schedule_refresh(provider))
+        return entry["domains"]
+
+    def _schedule_refresh(self, provider: str) -> asyncio.Task:
+        task = self._refreshing.get(provider)
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._refresh(provider))
+            self._refreshing[provider] = task
+        return task
+
+    async def _refresh(self, provider: str):
+        entry = self._entries[provider]
+        self._stats["refreshes"] += 1
+        try:
+            domains = await self._loaders[provider]()
+        except Exception as e:
+            domains = []
+            logger.error(f"❌ {provider} domain refresh error: {e}")
+
+        if domains:
+            entry["domains"] = list(domains)
+            entry["expires_at"] = time.time() + self.ttl
+            logger.info(f"✅ Cached {len(domains)} {provider} domains")
+        else:
+            self._stats["refresh_failures"] += 1
+            if entry["domains"]:
+                logger.warning(f"⚠️ Keeping stale {provider} domains after failed refresh")
+
+    async def _refresh_loop(self):
+        """Proactively refresh warm entries before they expire"""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            now = time.time()
+            for provider, entry in self._entries.items():
+                if entry["domains"] and now >= entry["expires_at"] - self.refresh_ahead:
+                    self._schedule_refresh(provider)
+
+    def start(self):
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        tasks = [t for t in [self._refresher, *self._refreshing.values()] if t and not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._refresher = None
+        self._refreshing.clear()
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            **self._stats,
+            "ttl": self.ttl,
+            "refresh_ahead": self.refresh_ahead,
+            "entries": {
+                provider: {
+                    "domains": len(entry["domains"]),
+                    "expires_in": max(0, int(entry["expires_at"] - now)),
+                    "refreshing": provider in self._refreshing and not self._refreshing[provider].done(),
+                }
+                for provider, entry in self._entries.items()
+            },
+        }
@@ -0,0 +1,90 @@
+"""Fan-out of inbox updates to push subscribers.
+
+Polling itself is owned by the polling scheduler; every result it publishes
+is diffed against the message ids already seen for that mailbox and only new
+messages are fanned out to the subscribers' queues, so N watchers of one
+inbox cost a single upstream poll loop.
+"""
+import asyncio
+import logging
+from typing import Dict, Hashable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class _Watcher:
+    __slots__ = ("key", "subscribers", "seen_ids", "messages")
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.seen_ids: Set[str] = set()
+        self.messages: Optional[List[dict]] = None
+
+
+class InboxWatcherHub:
+    """Broadcasts snapshot / new-message events to every subscriber of a mailbox"""
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._watchers: Dict[Hashable, _Watcher] = {}
+        self._stats = {"publishes": 0, "events": 0}
+
+    def subscribe(self, key: Hashable) -> asyncio.Queue:
+        """Register a subscriber; it immediately gets a snapshot if one is known"""
+        watcher = self._watchers.get(key)
+        if watcher is None:
+            watcher = self._watchers[key] = _Watcher(key)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        watcher.subscribers.add(queue)
+        if watcher.messages is not None:
+            queue.put_nowait({"type": "snapshot", "data": {"messages": watcher.messages, "count": len(watcher.messages)}})
+        return queue
+
+    def unsubscribe(self, key: Hashable, queue: asyncio.Queue):
+        watcher = self._watchers.get(key)
+        if watcher is None:
+            return
+        watcher.subscribers.discard(queue)
+        if not watcher.subscribers:
+            del self._watchers[key]
+
+    def _broadcast(self, watcher: _Watcher, event: dict):
+        for queue in watcher.subscribers:
+            if queue.full():
+                # Slow consumer: drop its oldest event rather than stall everyone
+                queue.get_nowait()
+            queue.put_nowait(event)
+        self._stats["events"] += 1
+
+    def publish(self, key: Hashable, messages: List[dict]):
+        """Feed a successful poll result for a mailbox (no-op when nobody is watching it)
+
+        The result replaces the snapshot sent to new subscribers, so failed
+        polls must not be published (the scheduler only publishes successes).
+        """
+        watcher = self._watchers.get(key)
+        if watcher is None:
+            return
+        self._stats["publishes"] += 1
+        first_poll = watcher.messages is None
+        watcher.messages = messages
+        if first_poll:
+            watcher.seen_ids = {str(m.get("id")) for m in messages}
+            self._broadcast(watcher, {"type": "snapshot", "data": {"messages": messages, "count": len(messages)}})
+            return
+        for message in messages:
+            message_id = str(message.get("id"))
+            if message_id not in watcher.seen_ids:
+                watcher.seen_ids.add(message_id)
+                self._broadcast(watcher, {"type": "new_message", "data": message})
+
+    def watched(self) -> List[Hashable]:
+        return list(self._watchers)
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "watched_mailboxes": len(self._watchers),
+            "subscribers": sum(len(w.subscribers) for w in self._watchers.values()),
+        }
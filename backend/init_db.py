@@ -3,8 +3,10 @@
 Script để khởi tạo database và tables cho ứng dụng TempMail
 """
 import sys
-from database import engine, Base, SQLALCHEMY_DATABASE_URL
-from models import TempEmail
+from database import engine, Base, SQLALCHEMY_DATABASE_URL, SessionLocal
+from sqlalchemy import inspect, select, update
+from sqlalchemy.schema import CreateColumn
+from models import TempEmail, SavedEmail, build_snippet
 import pymysql
 import os
 from dotenv import load_dotenv
@@ -76,6 +78,83 @@ def create_tables():
         print(f"❌ Lỗi tạo tables: {e}")
         return False
 
+def create_missing_indexes():
+    """Tạo các index còn thiếu trên tables đã tồn tại (create_all không sửa tables cũ)"""
+    try:
+        print("\n🔎 Đang kiểm tra index...")
+        inspector = inspect(engine)
+        existing_tables = set(inspector.get_table_names())
+        created = 0
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    # Ví dụ: CREATE INDEX ix_temp_emails_expires_at ON temp_emails (expires_at)
+                    index.create(bind=engine)
+                    print(f"   + {index.name}")
+                    created += 1
+        print(f"✅ Index đã đầy đủ ({created} index mới)")
+        return True
+    except Exception as e:
+        print(f"❌ Lỗi tạo index: {e}")
+        return False
+
+def create_missing_columns():
+    """Thêm các cột mới vào tables đã tồn tại (ví dụ saved_emails.snippet)"""
+    try:
+        print("\n🔎 Đang kiểm tra cột...")
+        inspector = inspect(engine)
+        existing_tables = set(inspector.get_table_names())
+        added = 0
+        with engine.begin() as connection:
+            for table in Base.metadata.sorted_tables:
+                if table.name not in existing_tables:
+                    continue
+                existing = {column["name"] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing:
+                        ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                        connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+                        print(f"   + {table.name}.{column.name}")
+                        added += 1
+        print(f"✅ Cột đã đầy đủ ({added} cột mới)")
+        return True
+    except Exception as e:
+        print(f"❌ Lỗi thêm cột: {e}")
+        return False
+
+def backfill_snippets(batch_size=500):
+    """Tính snippet cho các email đã lưu trước khi có cột snippet"""
+    db = SessionLocal()
+    try:
+        filled = 0
+        last_id = 0
+        while True:
+            rows = db.execute(
+                select(SavedEmail.id, SavedEmail.text, SavedEmail.html)
+                .where(SavedEmail.snippet.is_(None), SavedEmail.id > last_id)
+                .order_by(SavedEmail.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            for row in rows:
+                db.execute(update(SavedEmail).where(SavedEmail.id == row.id).values(snippet=build_snippet(row.text, row.html)))
+            db.commit()
+            filled += len(rows)
+            last_id = rows[-1].id
+        if filled:
+            print(f"✅ Đã tạo snippet cho {filled} email đã lưu")
+        return True
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Lỗi tạo snippet: {e}")
+        return False
+    finally:
+        db.close()
+
 def main():
     print("="*60)
     print("🚀 KHỞI TẠO DATABASE CHO ỨNG DỤNG TEMPMAIL")
@@ -106,6 +185,16 @@ def main():
         print("\n❌ Không thể tạo tables. Vui lòng sửa lỗi và thử lại.")
         sys.exit(1)
     
+    # Bước 4: Bổ sung cột mới cho tables cũ (saved_emails.snippet, ...) và tính snippet cho dữ liệu cũ
+    if not create_missing_columns() or not backfill_snippets():
+        print("\n❌ Không thể cập nhật cột. Vui lòng sửa lỗi và thử lại.")
+        sys.exit(1)
+    
+    # Bước 5: Bổ sung index mới cho tables cũ (expires_at, created_at, expired_at, saved_at, ...)
+    if not create_missing_indexes():
+        print("\n❌ Không thể tạo index. Vui lòng sửa lỗi và thử lại.")
+        sys.exit(1)
+    
     print("\n" + "="*60)
     print("✅ HOÀN THÀNH! Database đã sẵn sàng sử dụng.")
     print("="*60)
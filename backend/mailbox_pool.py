@@ -0,0 +1,149 @@
+"""Pre-provisioned pool of ready-made provider accounts.
+
+A background task keeps between ``low_watermark`` and ``high_watermark``
+accounts per provider, so ``/api/emails/create`` can hand one out without any
+upstream round trip when the caller did not ask for a specific username.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+AccountFactory = Callable[[str], Awaitable[Optional[dict]]]
+AccountDiscarder = Callable[[dict], Awaitable[None]]
+
+
+class MailboxPool:
+    """Per-provider pool of warm accounts with watermark-based refill"""
+
+    def __init__(
+        self,
+        providers: List[str],
+        factory: AccountFactory,
+        discarder: Optional[AccountDiscarder] = None,
+        low_watermark: int = 2,
+        high_watermark: int = 5,
+        max_age: float = 600,
+        refill_concurrency: int = 2,
+        check_interval: float = 5,
+        drain_timeout: float = 10,
+    ):
+        self.providers = providers
+        self.factory = factory
+        self.discarder = discarder
+        self.low_watermark = low_watermark
+        self.high_watermark = max(high_watermark, low_watermark)
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.drain_timeout = drain_timeout
+        self._stopped = False
+        self._semaphore = asyncio.Semaphore(refill_concurrency)
+        self._pools: Dict[str, deque] = {provider: deque() for provider in providers}
+        self._filling: Dict[str, int] = {provider: 0 for provider in providers}
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"hits": 0, "misses": 0, "created": 0, "create_failures": 0, "expired": 0, "drained": 0}
+
+    def take(self, provider: str, domain: Optional[str] = None) -> Optional[dict]:
+        """Pop a fresh account for ``provider`` (optionally on ``domain``), or None"""
+        pool = self._pools.get(provider)
+        if pool is None:
+            return None
+        self._evict_expired(provider)
+        for account in pool:
+            if domain is None or account["domain"] == domain:
+                pool.remove(account)
+                self._stats["hits"] += 1
+                return dict(account["account"])
+        self._stats["misses"] += 1
+        return None
+
+    def _evict_expired(self, provider: str):
+        pool = self._pools[provider]
+        now = time.time()
+        while pool and now - pool[0]["created_at"] > self.max_age:
+            account = pool.popleft()
+            self._stats["expired"] += 1
+            if self.discarder:
+                asyncio.create_task(self.discarder(account["account"]))
+
+    async def _create_one(self, provider: str):
+        async with self._semaphore:
+            try:
+                account = await self.factory(provider)
+            except Exception as e:
+                account = None
+                logger.warning(f"⚠️ Pool refill for {provider} failed: {e}")
+            finally:
+                self._filling[provider] -= 1
+        if account and self._stopped:
+            # Refill finished after shutdown started: nobody will take it
+            if self.discarder:
+                await self.discarder(account)
+        elif account:
+            self._pools[provider].append({"account": account, "domain": account["domain"], "created_at": time.time()})
+            self._stats["created"] += 1
+        else:
+            self._stats["create_failures"] += 1
+
+    def _refill(self):
+        for provider in self.providers:
+            self._evict_expired(provider)
+            available = len(self._pools[provider]) + self._filling[provider]
+            if available < self.low_watermark:
+                for _ in range(self.high_watermark - available):
+                    self._filling[provider] += 1
+                    asyncio.create_task(self._create_one(provider))
+
+    async def _run(self):
+        while True:
+            try:
+                self._refill()
+            except Exception as e:
+                logger.error(f"❌ Mailbox pool refill error: {e}")
+            await asyncio.sleep(self.check_interval)
+
+    def start(self):
+        self._stopped = False
+        if self.providers and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"🏊 Mailbox pool started for: {', '.join(self.providers)}")
+
+    async def stop(self):
+        """Stop refilling and discard every pooled account upstream (bounded by drain_timeout)"""
+        self._stopped = True
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        accounts = []
+        for pool in self._pools.values():
+            accounts.extend(entry["account"] for entry in pool)
+            pool.clear()
+        if not accounts:
+            return
+        if not self.discarder:
+            logger.warning(f"⚠️ Abandoning {len(accounts)} pooled accounts (no discarder)")
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(self.discarder(account) for account in accounts), return_exceptions=True),
+                timeout=self.drain_timeout
+            )
+            self._stats["drained"] += len(accounts)
+            logger.info(f"🏊 Discarded {len(accounts)} pooled accounts on shutdown")
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Timed out discarding {len(accounts)} pooled accounts on shutdown")
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "low_watermark": self.low_watermark,
+            "high_watermark": self.high_watermark,
+            "max_age": self.max_age,
+            "sizes": {provider: len(pool) for provider, pool in self._pools.items()},
+            "filling": dict(self._filling),
+        }
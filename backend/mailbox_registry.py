@@ -0,0 +1,62 @@
+"""In-process registry of active mailboxes.
+
+Message endpoints only need a mailbox's identity (provider, address, token,
+...) which practically never changes, so compact slot-based records are kept
+in a bounded LRU and the inbox / message-detail hot paths resolve mailboxes
+without a database round trip. Records are written through on create and
+dropped on delete, extend and token refresh; a record past its expiry is
+treated as a miss so the next lookup reloads the row.
+"""
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+
+class MailboxRecord:
+    """Snapshot of a TempEmail row (duck-types the attributes the hot paths use)"""
+
+    __slots__ = (
+        "id", "address", "password", "token", "account_id", "provider",
+        "username", "domain", "created_at", "expires_at", "message_count",
+    )
+
+    def __init__(self, row):
+        for field in self.__slots__:
+            setattr(self, field, getattr(row, field))
+
+
+class MailboxRegistry:
+    """Bounded LRU of MailboxRecord keyed by mailbox id"""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._records: "OrderedDict[int, MailboxRecord]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, email_id: int) -> Optional[MailboxRecord]:
+        record = self._records.get(email_id)
+        # Stored as naive UTC, like the expires_at column
+        if record is None or record.expires_at <= datetime.utcnow():
+            self._stats["misses"] += 1
+            return None
+        self._records.move_to_end(email_id)
+        self._stats["hits"] += 1
+        return record
+
+    def put(self, row) -> MailboxRecord:
+        """Store (or replace) the record for a freshly loaded/created row"""
+        record = row if isinstance(row, MailboxRecord) else MailboxRecord(row)
+        self._records[record.id] = record
+        self._records.move_to_end(record.id)
+        while len(self._records) > self.max_size:
+            self._records.popitem(last=False)
+            self._stats["evictions"] += 1
+        return record
+
+    def invalidate(self, email_id: int, *_):
+        """Drop a mailbox (extra arguments are ignored so it can be used as a listener)"""
+        if self._records.pop(email_id, None) is not None:
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> dict:
+        return {**self._stats, "size": len(self._records), "max_size": self.max_size}
@@ -0,0 +1,66 @@
+"""Byte-bounded LRU cache for message details.
+
+A message body never changes once delivered, so details are cached by
+(provider, account, message_id) and evicted least-recently-used once the
+total size of their html/text content exceeds ``max_bytes``.
+"""
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+def message_size(message: dict) -> int:
+    """Approximate memory cost of a message: UTF-8 size of its html and text parts"""
+    size = 0
+    for field in ("html", "text"):
+        value = message.get(field) or []
+        parts = value if isinstance(value, list) else [value]
+        for part in parts:
+            if isinstance(part, str):
+                size += len(part.encode("utf-8"))
+    return size
+
+
+class MessageCache:
+    """LRU cache bounded by the total byte size of cached bodies"""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_item_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes if max_item_bytes is not None else max_bytes // 8
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "skipped_too_large": 0}
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return entry[0]
+
+    def put(self, key: Hashable, message: dict):
+        size = message_size(message)
+        if size > self.max_item_bytes:
+            self._stats["skipped_too_large"] += 1
+            return
+        self.discard(key)
+        self._entries[key] = (message, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._stats["evictions"] += 1
+
+    def discard(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
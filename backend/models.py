@@ -1,6 +1,23 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Text
+from sqlalchemy.orm import deferred
 from database import Base
 from datetime import datetime, timezone, timedelta
+import html as html_lib
+import re
+
+SNIPPET_LENGTH = 200
+
+
+def build_snippet(text, html, length=SNIPPET_LENGTH):
+    """Short plain-text preview of a message body (prefers the text part)"""
+    source = text
+    if not source and html:
+        source = re.sub(r"<(script|style)\b.*?</\1>", " ", html, flags=re.S | re.I)
+        source = html_lib.unescape(re.sub(r"<[^>]+>", " ", source))
+    if not source:
+        return ""
+    source = " ".join(source.split())
+    return source if len(source) <= length else source[:length - 1].rstrip() + "…"
 
 class TempEmail(Base):
     __tablename__ = "temp_emails"
@@ -11,8 +28,8 @@ class TempEmail(Base):
     token = Column(Text, nullable=False)
     account_id = Column(String(255), nullable=False)
     # Store naive UTC in MySQL DATETIME
-    created_at = Column(DateTime, default=lambda: datetime.utcnow(), nullable=False)
-    expires_at = Column(DateTime, nullable=False)  # Expiry time
+    created_at = Column(DateTime, default=lambda: datetime.utcnow(), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)  # Expiry time
     message_count = Column(Integer, default=0, nullable=False)
     provider = Column(String(50), default="mailtm", nullable=False)  # Provider tracking (mailtm/mailgw/1secmail)
     mailbox_id = Column(String(255), nullable=True)  # For SMTPLabs mailbox tracking (legacy)
@@ -57,7 +74,7 @@ class EmailHistory(Base):
     token = Column(Text, nullable=False)
     account_id = Column(String(255), nullable=False)
     created_at = Column(DateTime, nullable=False)
-    expired_at = Column(DateTime, nullable=False)  # When it expired
+    expired_at = Column(DateTime, nullable=False, index=True)  # When it expired
     message_count = Column(Integer, default=0, nullable=False)
     
     def to_dict(self):
@@ -92,13 +109,15 @@ class SavedEmail(Base):
     subject = Column(String(500), nullable=True)
     from_address = Column(String(255), nullable=True)
     from_name = Column(String(255), nullable=True)
-    html = Column(Text, nullable=True)  # HTML content
-    text = Column(Text, nullable=True)  # Text content
+    # Bodies are only loaded when accessed (the list view never needs them)
+    html = deferred(Column(Text, nullable=True))  # HTML content
+    text = deferred(Column(Text, nullable=True))  # Text content
+    snippet = Column(String(SNIPPET_LENGTH + 10), nullable=True)  # Preview computed at save time
     created_at = Column(DateTime, nullable=False)  # When message was created
-    saved_at = Column(DateTime, default=lambda: datetime.utcnow(), nullable=False)  # When saved
+    saved_at = Column(DateTime, default=lambda: datetime.utcnow(), nullable=False, index=True)  # When saved
     
-    def to_dict(self):
-        """Convert model to dictionary"""
+    def to_summary(self):
+        """Header fields and snippet only (does not touch the deferred bodies)"""
         created_at = self.created_at
         if created_at.tzinfo is None:
             created_at = created_at.replace(tzinfo=timezone.utc)
@@ -116,8 +135,64 @@ class SavedEmail(Base):
                 "address": self.from_address,
                 "name": self.from_name
             },
-            "html": [self.html] if self.html else [],
-            "text": [self.text] if self.text else [],
+            "snippet": self.snippet or "",
             "createdAt": created_at.isoformat(),
             "saved_at": saved_at.isoformat()
         }
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            **self.to_summary(),
+            "html": [self.html] if self.html else [],
+            "text": [self.text] if self.text else []
+        }
+
+
+class LocalMessage(Base):
+    """Messages received by the built-in SMTP listener (provider "local")"""
+    __tablename__ = "local_messages"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    message_id = Column(String(64), unique=True, nullable=False)  # Public message ID
+    mailbox_address = Column(String(255), nullable=False, index=True)  # Recipient mailbox
+    from_address = Column(String(255), nullable=True)
+    from_name = Column(String(255), nullable=True)
+    subject = Column(String(500), nullable=True)
+    html = Column(Text(16777215), nullable=True)  # MEDIUMTEXT on MySQL
+    text = Column(Text(16777215), nullable=True)
+    received_at = Column(DateTime, default=lambda: datetime.utcnow(), nullable=False, index=True)
+    
+    def to_summary(self):
+        """Message list entry in the same shape as the HTTP providers"""
+        received_at = self.received_at
+        if received_at.tzinfo is None:
+            received_at = received_at.replace(tzinfo=timezone.utc)
+        
+        return {
+            "id": self.message_id,
+            "from": {
+                "address": self.from_address,
+                "name": self.from_name
+            },
+            "subject": self.subject,
+            "createdAt": received_at.isoformat()
+        }
+    
+    def to_dict(self):
+        """Full message detail (html/text as arrays like the other providers)"""
+        return {
+            **self.to_summary(),
+            "html": [self.html] if self.html else [],
+            "text": [self.text] if self.text else []
+        }
+
+
+class SharedState(Base):
+    """Small key/value store shared by all workers (provider circuits, stats, domains)"""
+    __tablename__ = "shared_state"
+    
+    key = Column(String(191), primary_key=True)
+    value = Column(Text, nullable=True)  # JSON document
+    counter = Column(BigInteger, default=0, nullable=False)  # For atomic increments
+    expires_at = Column(DateTime, nullable=True, index=True)  # NULL = never expires
@@ -0,0 +1,67 @@
+"""Keyset (cursor) pagination and field projection for list endpoints.
+
+Pages are ordered by ``(sort_column DESC, id DESC)`` and the cursor encodes
+the last row's sort value and id, so fetching page N costs the same index
+range scan as page 1 instead of an ever-growing OFFSET.
+"""
+import base64
+from datetime import datetime
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    raw = f"{sort_value.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+async def keyset_page(db, stmt, sort_column, id_column, limit: Optional[int], cursor: Optional[str] = None):
+    """Run ``stmt`` (an ORM select) with keyset ordering/filtering; returns (rows, next_cursor)
+
+    ``limit=None`` keeps the legacy unpaginated behaviour (no next cursor).
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        stmt = stmt.where(or_(
+            sort_column < sort_value,
+            and_(sort_column == sort_value, id_column < row_id)
+        ))
+    stmt = stmt.order_by(sort_column.desc(), id_column.desc())
+    if limit is None:
+        return (await db.scalars(stmt)).all(), None
+
+    # One extra row tells us whether another page exists
+    rows = (await db.scalars(stmt.limit(limit + 1))).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[Set[str]]:
+    """Parse a ``fields=a,b,c`` projection; None means all fields. Raises ValueError on unknown names"""
+    if not fields:
+        return None
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested
+
+
+def project(items: List[dict], fields: Optional[Set[str]]) -> List[dict]:
+    if fields is None:
+        return items
+    return [{key: value for key, value in item.items() if key in fields} for item in items]
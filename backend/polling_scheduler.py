@@ -0,0 +1,341 @@
+"""Central adaptive inbox polling scheduler.
+
+The scheduler owns upstream polling for the active mailboxes:
+
+- each mailbox has its own interval: fast right after creation, after new
+  mail or while someone is watching it, backing off geometrically when idle;
+- due mailboxes sit in a priority queue and the busiest (watched, recently
+  active) ones are polled first;
+- every provider has a global polls-per-second budget, so upstream load stays
+  bounded no matter how many clients are connected;
+- client reads (``read``) are answered from the last poll while it is fresh
+  enough, mark the mailbox as viewed so it stays on the fast schedule, and
+  only poll upstream themselves when no fresh result exists.
+
+Poll results are handed to listeners (e.g. the SSE fan-out hub). The fetch
+function must raise when a poll fails, so a failed poll never reaches the
+listeners or replaces the last good result as if the inbox were empty.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from datetime import timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MessageFetcher = Callable[[object], Awaitable[List[dict]]]
+MailboxLoader = Callable[[], List[object]]
+PollListener = Callable[[int, List[dict]], None]
+
+
+def _timestamp(value) -> float:
+    if value is None:
+        return 0.0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class _ProviderBudget:
+    """Token bucket of polls per second for one provider"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def try_take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class _MailboxState:
+    __slots__ = (
+        "email_id", "mailbox", "provider", "created_at", "interval", "last_activity",
+        "seen_ids", "messages", "polled_at", "watchers", "viewed_at", "polling", "version",
+    )
+
+    def __init__(self, mailbox, min_interval: float):
+        self.email_id = mailbox.id
+        self.mailbox = mailbox
+        self.provider = mailbox.provider
+        self.created_at = _timestamp(getattr(mailbox, "created_at", None)) or time.time()
+        self.interval = min_interval
+        self.last_activity = 0.0
+        self.seen_ids: Optional[set] = None
+        self.messages: Optional[List[dict]] = None
+        self.polled_at = 0.0
+        self.watchers = 0
+        self.viewed_at = 0.0
+        self.polling = False
+        self.version = 0
+
+
+class PollingScheduler:
+    """Owns upstream inbox polling for all active mailboxes"""
+
+    def __init__(
+        self,
+        fetch: MessageFetcher,
+        loader: Optional[MailboxLoader] = None,
+        min_interval: float = 5,
+        max_interval: float = 300,
+        watched_max_interval: float = 15,
+        backoff: float = 1.5,
+        hot_window: float = 120,
+        budgets: Optional[Dict[str, float]] = None,
+        default_budget: float = 2.0,
+        max_concurrency: int = 10,
+        tick: float = 0.5,
+        sync_interval: float = 60,
+    ):
+        self.fetch = fetch
+        self.loader = loader
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.watched_max_interval = watched_max_interval
+        self.backoff = backoff
+        self.hot_window = hot_window
+        self.default_budget = default_budget
+        self.max_concurrency = max_concurrency
+        self.tick = tick
+        self.sync_interval = sync_interval
+        self._budget_rates = budgets or {}
+        self._budgets: Dict[str, _ProviderBudget] = {}
+        self._states: Dict[int, _MailboxState] = {}
+        self._heap: list = []
+        self._listeners: List[PollListener] = []
+        self._running = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "polls": 0, "poll_errors": 0, "deferred": 0, "new_messages": 0,
+            "reads_fresh": 0, "reads_stale": 0, "reads_polled": 0,
+        }
+
+    # --- registration -------------------------------------------------
+
+    def add_listener(self, listener: PollListener):
+        self._listeners.append(listener)
+
+    def track(self, mailbox):
+        """Start (or keep) polling a mailbox; refreshes the stored row if already tracked"""
+        state = self._states.get(mailbox.id)
+        if state is None:
+            state = self._states[mailbox.id] = _MailboxState(mailbox, self.min_interval)
+            self._schedule(state, time.time())
+        else:
+            state.mailbox = mailbox
+
+    def untrack(self, email_id: int):
+        self._states.pop(email_id, None)
+
+    def watch(self, email_id: int):
+        """A client is watching this mailbox: poll it soon and keep it fast"""
+        state = self._states.get(email_id)
+        if state is not None:
+            state.watchers += 1
+            state.interval = self.min_interval
+            self.poll_soon(email_id)
+
+    def unwatch(self, email_id: int):
+        state = self._states.get(email_id)
+        if state is not None and state.watchers > 0:
+            state.watchers -= 1
+
+    def poll_soon(self, email_id: int):
+        state = self._states.get(email_id)
+        if state is not None and not state.polling:
+            self._schedule(state, time.time())
+
+    def poll_address(self, address: str):
+        """Poll every tracked mailbox with this address soon (e.g. after local delivery)"""
+        address = address.lower()
+        for state in self._states.values():
+            if state.mailbox.address.lower() == address:
+                self.poll_soon(state.email_id)
+
+    def latest(self, email_id: int):
+        """Most recent poll result as (messages, polled_at), or None"""
+        state = self._states.get(email_id)
+        if state is None or state.messages is None:
+            return None
+        return state.messages, state.polled_at
+
+    async def read(self, mailbox, max_age: float) -> List[dict]:
+        """Messages for a client request: the last poll result if at most ``max_age`` old, else a poll now
+
+        The mailbox counts as viewed, so it is kept on the watched schedule. An
+        upstream poll made here takes from the provider budget; when the budget
+        is spent and an older result exists, that result is served instead.
+        Raises whatever the fetch raises on failure.
+        """
+        self.track(mailbox)
+        state = self._states[mailbox.id]
+        now = time.time()
+        if not state.watchers and now - state.viewed_at >= self.hot_window and not state.polling:
+            # Newly viewed: pull it back from a long idle interval
+            state.interval = self.min_interval
+            self._schedule(state, max(now, state.polled_at + self.min_interval))
+        state.viewed_at = now
+
+        if state.messages is not None:
+            if now - state.polled_at <= max_age:
+                self._stats["reads_fresh"] += 1
+                return state.messages
+            if not self._budget(state.provider).try_take():
+                self._stats["reads_stale"] += 1
+                self.poll_soon(state.email_id)
+                return state.messages
+        else:
+            self._budget(state.provider).try_take()
+
+        self._stats["reads_polled"] += 1
+        messages = await self.fetch(state.mailbox)
+        had_new = self._ingest(state, messages)
+        if not state.polling and self._states.get(state.email_id) is state:
+            state.interval = self._next_interval(state, time.time(), had_new)
+            self._schedule(state, time.time() + state.interval)
+        return messages
+
+    # --- scheduling ---------------------------------------------------
+
+    def _budget(self, provider: str) -> _ProviderBudget:
+        budget = self._budgets.get(provider)
+        if budget is None:
+            budget = self._budgets[provider] = _ProviderBudget(self._budget_rates.get(provider, self.default_budget))
+        return budget
+
+    def _viewed(self, state: _MailboxState, now: float) -> bool:
+        return bool(state.watchers) or now - state.viewed_at < self.hot_window
+
+    def _priority(self, state: _MailboxState, now: float) -> float:
+        priority = state.watchers * 10.0
+        if not state.watchers and now - state.viewed_at < self.hot_window:
+            priority += 10.0
+        if now - state.last_activity < self.hot_window:
+            priority += 5.0
+        if now - state.created_at < self.hot_window:
+            priority += 2.0
+        return priority
+
+    def _schedule(self, state: _MailboxState, due: float):
+        state.version += 1
+        heapq.heappush(self._heap, (due, -self._priority(state, time.time()), state.version, state.email_id))
+
+    def _next_interval(self, state: _MailboxState, now: float, had_new: bool) -> float:
+        if had_new or now - state.created_at < self.hot_window or now - state.last_activity < self.hot_window:
+            return self.min_interval
+        cap = self.watched_max_interval if self._viewed(state, now) else self.max_interval
+        return min(max(state.interval, self.min_interval) * self.backoff, cap)
+
+    def _dispatch_due(self):
+        now = time.time()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, version, email_id = heapq.heappop(self._heap)
+            state = self._states.get(email_id)
+            if state is not None and state.version == version and not state.polling:
+                due.append(state)
+
+        # Busiest mailboxes first; whatever exceeds the budget waits for the next tick
+        due.sort(key=lambda s: self._priority(s, now), reverse=True)
+        for state in due:
+            if self._running >= self.max_concurrency or not self._budget(state.provider).try_take():
+                self._stats["deferred"] += 1
+                self._schedule(state, now + self.tick)
+                continue
+            state.polling = True
+            self._running += 1
+            asyncio.create_task(self._poll(state))
+
+    def _ingest(self, state: _MailboxState, messages: List[dict]) -> bool:
+        """Store a successful poll result and hand it to the listeners; True if it had new mail"""
+        had_new = False
+        ids = {str(m.get("id")) for m in messages}
+        if state.seen_ids is not None and ids - state.seen_ids:
+            had_new = True
+            self._stats["new_messages"] += len(ids - state.seen_ids)
+            state.last_activity = time.time()
+        state.seen_ids = ids
+        state.messages = messages
+        state.polled_at = time.time()
+        for listener in self._listeners:
+            try:
+                listener(state.email_id, messages)
+            except Exception as e:
+                logger.error(f"❌ Poll listener error for mailbox {state.email_id}: {e}")
+        return had_new
+
+    async def _poll(self, state: _MailboxState):
+        had_new = False
+        try:
+            self._stats["polls"] += 1
+            messages = await self.fetch(state.mailbox)
+            had_new = self._ingest(state, messages)
+        except Exception as e:
+            self._stats["poll_errors"] += 1
+            logger.warning(f"⚠️ Scheduled poll failed for mailbox {state.email_id}: {e}")
+        finally:
+            self._running -= 1
+            state.polling = False
+            if self._states.get(state.email_id) is state:
+                now = time.time()
+                state.interval = self._next_interval(state, now, had_new)
+                self._schedule(state, now + state.interval)
+
+    async def _sync(self):
+        """Reconcile the tracked set with the active mailbox rows"""
+        if self.loader is None:
+            return
+        mailboxes = await asyncio.to_thread(self.loader)
+        active_ids = set()
+        for mailbox in mailboxes:
+            active_ids.add(mailbox.id)
+            self.track(mailbox)
+        for email_id in list(self._states):
+            if email_id not in active_ids and not self._states[email_id].watchers:
+                self.untrack(email_id)
+
+    async def _run(self):
+        last_sync = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_sync >= self.sync_interval:
+                    last_sync = time.monotonic()
+                    await self._sync()
+                self._dispatch_due()
+            except Exception as e:
+                logger.error(f"❌ Polling scheduler error: {e}")
+            await asyncio.sleep(self.tick)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info("🗓️ Polling scheduler started")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "tracked_mailboxes": len(self._states),
+            "watched_mailboxes": sum(1 for s in self._states.values() if s.watchers),
+            "viewed_mailboxes": sum(1 for s in self._states.values() if self._viewed(s, time.time())),
+            "in_flight": self._running,
+            "queued": len(self._heap),
+            "budgets": {p: b.rate for p, b in self._budgets.items()},
+        }
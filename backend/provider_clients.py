@@ -0,0 +1,114 @@
+"""Shared, pooled httpx clients for the email providers.
+
+Each provider gets one long-lived ``httpx.AsyncClient`` so inbox polling reuses
+warm keep-alive connections instead of paying a TCP + TLS handshake per call.
+"""
+import os
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Pool configuration (shared defaults, overridable per provider via env)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_DEFAULT_TIMEOUT = float(os.getenv("HTTP_DEFAULT_TIMEOUT", "10"))
+
+
+def _env_key(provider: str) -> str:
+    return provider.upper().replace(".", "_").replace("-", "_")
+
+
+class ProviderClientRegistry:
+    """Registry of one keep-alive ``httpx.AsyncClient`` per provider"""
+
+    def __init__(self):
+        self._configs: Dict[str, dict] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def register(
+        self,
+        provider: str,
+        base_url: str,
+        timeout: Optional[float] = None,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        headers: Optional[dict] = None,
+    ):
+        """Register a provider; env vars like MAILTM_HTTP_TIMEOUT override the given values"""
+        key = _env_key(provider)
+        self._configs[provider] = {
+            "base_url": base_url,
+            "timeout": float(os.getenv(f"{key}_HTTP_TIMEOUT", timeout or HTTP_DEFAULT_TIMEOUT)),
+            "max_connections": int(os.getenv(f"{key}_HTTP_MAX_CONNECTIONS", max_connections or HTTP_MAX_CONNECTIONS)),
+            "max_keepalive_connections": int(os.getenv(
+                f"{key}_HTTP_MAX_KEEPALIVE_CONNECTIONS",
+                max_keepalive_connections or HTTP_MAX_KEEPALIVE_CONNECTIONS
+            )),
+            "keepalive_expiry": float(os.getenv(f"{key}_HTTP_KEEPALIVE_EXPIRY", keepalive_expiry or HTTP_KEEPALIVE_EXPIRY)),
+            "headers": headers or {},
+        }
+
+    def _build_client(self, provider: str) -> httpx.AsyncClient:
+        config = self._configs[provider]
+        return httpx.AsyncClient(
+            timeout=config["timeout"],
+            headers=config["headers"],
+            limits=httpx.Limits(
+                max_connections=config["max_connections"],
+                max_keepalive_connections=config["max_keepalive_connections"],
+                keepalive_expiry=config["keepalive_expiry"],
+            ),
+        )
+
+    async def start(self):
+        """Open a client for every registered provider (called on app startup)"""
+        for provider in self._configs:
+            if provider not in self._clients:
+                self._clients[provider] = self._build_client(provider)
+        logger.info(f"🔌 HTTP client pools ready: {', '.join(self._clients)}")
+
+    def get(self, provider: str) -> httpx.AsyncClient:
+        """Return the pooled client for a provider, creating it lazily if needed"""
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            if provider not in self._configs:
+                raise KeyError(f"Unknown provider: {provider}")
+            client = self._build_client(provider)
+            self._clients[provider] = client
+        return client
+
+    def base_url(self, provider: str) -> str:
+        return self._configs[provider]["base_url"]
+
+    def stats(self) -> dict:
+        """Pool configuration per provider (for the status endpoint)"""
+        return {
+            provider: {
+                "base_url": config["base_url"],
+                "timeout": config["timeout"],
+                "max_connections": config["max_connections"],
+                "max_keepalive_connections": config["max_keepalive_connections"],
+                "keepalive_expiry": config["keepalive_expiry"],
+                "open": provider in self._clients and not self._clients[provider].is_closed,
+            }
+            for provider, config in self._configs.items()
+        }
+
+    async def close(self):
+        """Close every pooled client (called on app shutdown)"""
+        clients = list(self._clients.items())
+        self._clients.clear()
+        for provider, client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"Error closing HTTP client for {provider}: {e}")
+        logger.info("🔌 HTTP client pools closed")
+
+
+provider_clients = ProviderClientRegistry()
@@ -0,0 +1,132 @@
+"""Latency-aware provider scoring.
+
+Tracks an EWMA of latency and error rate plus recent 429s per provider and per
+operation ("create", "list", "detail"), and ranks providers by expected
+time-to-success so traffic shifts to whichever provider is currently fastest.
+Calls refused locally (``local_errors``, e.g. our own rate budget) never reached
+the provider, so they are only counted as throttled and do not affect scores.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple, Type
+
+from fastapi import HTTPException
+
+
+class _OperationStats:
+    __slots__ = ("latency", "error_rate", "samples", "last_update", "rate_limits", "throttled")
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.last_update = 0.0
+        self.rate_limits = deque()
+        self.throttled = 0
+
+
+class ProviderScorer:
+    """EWMA latency / error-rate tracker used to order provider candidates"""
+
+    def __init__(
+        self,
+        alpha: float = 0.3,
+        prior_latency: float = 1.0,
+        decay_half_life: float = 300,
+        rate_limit_window: float = 120,
+        rate_limit_penalty: float = 5.0,
+        min_success_probability: float = 0.05,
+        local_errors: Tuple[Type[BaseException], ...] = (),
+    ):
+        self.alpha = alpha
+        self.prior_latency = prior_latency
+        self.decay_half_life = decay_half_life
+        self.rate_limit_window = rate_limit_window
+        self.rate_limit_penalty = rate_limit_penalty
+        self.min_success_probability = min_success_probability
+        self.local_errors = local_errors
+        self._stats: Dict[Tuple[str, str], _OperationStats] = {}
+
+    def _get(self, provider: str, operation: str) -> _OperationStats:
+        key = (provider, operation)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = _OperationStats()
+        return stats
+
+    def record(self, provider: str, operation: str, latency: float, ok: bool, rate_limited: bool = False):
+        """Record one upstream call outcome"""
+        stats = self._get(provider, operation)
+        now = time.time()
+        if stats.latency is None:
+            stats.latency = latency
+        else:
+            stats.latency += self.alpha * (latency - stats.latency)
+        stats.error_rate += self.alpha * ((0.0 if ok else 1.0) - stats.error_rate)
+        stats.samples += 1
+        stats.last_update = now
+        if rate_limited:
+            stats.rate_limits.append(now)
+        self._trim(stats, now)
+
+    @asynccontextmanager
+    async def track(self, provider: str, operation: str):
+        """Time the wrapped block and record it as a success or failure"""
+        started = time.monotonic()
+        try:
+            yield
+        except self.local_errors:
+            self._get(provider, operation).throttled += 1
+            raise
+        except HTTPException as e:
+            # 401 means an expired token, not an unhealthy provider
+            ok = e.status_code == 401
+            self.record(provider, operation, time.monotonic() - started, ok, rate_limited=e.status_code == 429)
+            raise
+        except asyncio.CancelledError:
+            # Cancelled (e.g. lost a race): the outcome is unknown, record nothing
+            raise
+        except Exception:
+            self.record(provider, operation, time.monotonic() - started, False)
+            raise
+        else:
+            self.record(provider, operation, time.monotonic() - started, True)
+
+    def _trim(self, stats: _OperationStats, now: float):
+        while stats.rate_limits and now - stats.rate_limits[0] > self.rate_limit_window:
+            stats.rate_limits.popleft()
+
+    def expected_time(self, provider: str, operation: str) -> float:
+        """Expected seconds until success: latency / P(success) plus a penalty for recent 429s"""
+        stats = self._stats.get((provider, operation))
+        if stats is None or stats.latency is None:
+            return self.prior_latency
+        now = time.time()
+        self._trim(stats, now)
+        # Old observations fade back toward the prior so a bad provider gets retried eventually
+        weight = math.exp(-math.log(2) * (now - stats.last_update) / self.decay_half_life)
+        latency = weight * stats.latency + (1 - weight) * self.prior_latency
+        error_rate = weight * stats.error_rate
+        success_probability = max(1.0 - error_rate, self.min_success_probability)
+        return latency / success_probability + len(stats.rate_limits) * self.rate_limit_penalty
+
+    def rank(self, providers: List[str], operation: str) -> List[str]:
+        """Order providers by expected time-to-success (ties keep the given order)"""
+        return sorted(providers, key=lambda p: self.expected_time(p, operation))
+
+    def snapshot(self) -> dict:
+        result: Dict[str, dict] = {}
+        for (provider, operation), stats in self._stats.items():
+            self._trim(stats, time.time())
+            result.setdefault(provider, {})[operation] = {
+                "latency_ewma": round(stats.latency, 3) if stats.latency is not None else None,
+                "error_rate": round(stats.error_rate, 3),
+                "recent_429s": len(stats.rate_limits),
+                "samples": stats.samples,
+                "throttled": stats.throttled,
+                "expected_time": round(self.expected_time(provider, operation), 3),
+            }
+        return result
@@ -0,0 +1,96 @@
+"""Client-side token-bucket rate limiting for upstream provider calls.
+
+Buckets are configured per provider (shared by all its calls) and per
+provider operation ("mailtm.create", "mailgw.list", ...). A call takes one
+token from every bucket that applies; when a bucket is empty the caller
+queues for at most ``max_wait`` seconds and is otherwise rejected, so we stay
+just under provider limits instead of running into their 429s.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def parse_rate_limits(raw: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "mailtm=8/8,mailtm.create=0.5/2" (rate per second / burst) into {key: (rate, burst)}"""
+    limits = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        rate, _, burst = value.strip().partition("/")
+        try:
+            rate = float(rate)
+            limits[key.strip()] = (rate, float(burst) if burst else max(1.0, rate))
+        except ValueError:
+            logger.warning(f"⚠️ Ignoring invalid rate limit: {item.strip()}")
+    return limits
+
+
+class TokenBucket:
+    """Token bucket whose balance may go negative: a negative balance is the queue of waiting callers"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token taken now would be covered"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class ProviderRateLimiter:
+    """Per-provider and per-operation token buckets acquired before every upstream call"""
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]], max_wait: float = 2.0):
+        self.max_wait = max_wait
+        self._buckets = {key: TokenBucket(rate, burst) for key, (rate, burst) in limits.items() if rate > 0}
+        self._stats = {"granted": 0, "delayed": 0, "rejected": 0, "wait_seconds": 0.0}
+
+    def _applicable(self, provider: str, operation: str) -> List[TokenBucket]:
+        return [
+            bucket for bucket in (self._buckets.get(provider), self._buckets.get(f"{provider}.{operation}"))
+            if bucket is not None
+        ]
+
+    async def acquire(self, provider: str, operation: str, max_wait: Optional[float] = None) -> bool:
+        """Take a token from each applicable bucket, waiting up to max_wait; False if over budget"""
+        buckets = self._applicable(provider, operation)
+        if not buckets:
+            return True
+        now = time.monotonic()
+        wait = max(bucket.wait_time(now) for bucket in buckets)
+        if wait > (self.max_wait if max_wait is None else max_wait):
+            self._stats["rejected"] += 1
+            return False
+        # Reserve now so later callers queue behind us
+        for bucket in buckets:
+            bucket.take()
+        self._stats["granted"] += 1
+        if wait > 0:
+            self._stats["delayed"] += 1
+            self._stats["wait_seconds"] += wait
+            await asyncio.sleep(wait)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "wait_seconds": round(self._stats["wait_seconds"], 2),
+            "buckets": {
+                key: {"rate": bucket.rate, "burst": bucket.burst, "tokens": round(bucket.tokens, 2)}
+                for key, bucket in self._buckets.items()
+            },
+        }
@@ -1,10 +1,13 @@
 """FastAPI server with MySQL/SQLAlchemy and multiple email providers (mail.tm, 1secmail, mail.gw, guerrilla, tempmail.lol)"""
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, Query
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import os
+import json
 import logging
 import asyncio
+import math
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional
@@ -13,6 +16,25 @@ import httpx
 import random
 import string
 import time
+from contextlib import nullcontext
+from sqlalchemy import select, insert, update, delete
+from provider_clients import provider_clients
+from singleflight import SingleFlight
+from domain_cache import DomainCache
+from provider_scoring import ProviderScorer
+from circuit_breaker import CircuitBreakerRegistry
+from rate_limiter import ProviderRateLimiter, parse_rate_limits
+from admission import AdmissionController, AdmissionMiddleware, InMemoryWindowStore, SharedWindowStore
+from shared_state import MemoryStateBackend, SharedProviderState, create_state_backend
+from token_manager import TokenManager
+from mailbox_pool import MailboxPool
+from message_cache import MessageCache
+from inbox_watcher import InboxWatcherHub
+from polling_scheduler import PollingScheduler
+from smtp_ingest import LocalSMTPServer, store_local_message
+from write_behind import WriteBehindBuffer
+from mailbox_registry import MailboxRegistry
+from pagination import keyset_page, parse_fields, project
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -37,9 +59,10 @@ if USE_MONGODB:
     logging.info("🍃 Using MongoDB for container environment")
 else:
     # MySQL setup
-    from sqlalchemy.orm import Session
-    from database import get_db, engine, SessionLocal
-    from models import TempEmail, EmailHistory, SavedEmail, Base
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from database import get_async_db, engine, async_engine, SessionLocal, AsyncSessionLocal
+    from sqlalchemy.orm import undefer
+    from models import TempEmail, EmailHistory, SavedEmail, LocalMessage, SharedState, Base, build_snippet
     Base.metadata.create_all(bind=engine)
     logging.info("🐬 Using MySQL for local environment")
 
@@ -55,29 +78,81 @@ ONESECMAIL_BASE_URL = "https://www.1secmail.com/api/v1"
 MAILGW_BASE_URL = "https://api.mail.gw"
 GUERRILLA_BASE_URL = "https://api.guerrillamail.com/ajax.php"
 
+# Shared keep-alive HTTP pools, one per provider (opened on startup, closed on shutdown)
+MAILGW_CREATE_TIMEOUT = float(os.getenv("MAILGW_CREATE_TIMEOUT", "30"))
+provider_clients.register("mailtm", MAILTM_BASE_URL, timeout=10.0)
+provider_clients.register("mailgw", MAILGW_BASE_URL, timeout=10.0)
+provider_clients.register("1secmail", ONESECMAIL_BASE_URL, timeout=10.0)
+provider_clients.register("guerrilla", GUERRILLA_BASE_URL, timeout=10.0)
+
 # Rate limiting configuration
-PROVIDER_COOLDOWN_SECONDS = 60
+PROVIDER_COOLDOWN_SECONDS = 60  # Base circuit open duration (doubles on each re-open)
 RETRY_MAX_ATTEMPTS = 3
 RETRY_BASE_DELAY = 1
 
-# Domain cache
-_domain_cache = {
-    "mailtm": {"domains": [], "expires_at": 0},
-    "1secmail": {"domains": [], "expires_at": 0},
-    "mailgw": {"domains": [], "expires_at": 0},
-    "guerrilla": {"domains": [], "expires_at": 0}
-}
+# Domain cache (stale-while-revalidate, refreshed in the background)
 DOMAIN_CACHE_TTL = 300  # 5 minutes
+DOMAIN_CACHE_REFRESH_AHEAD = int(os.getenv("DOMAIN_CACHE_REFRESH_AHEAD", "60"))
+domain_cache = DomainCache(ttl=DOMAIN_CACHE_TTL, refresh_ahead=DOMAIN_CACHE_REFRESH_AHEAD)
 
 # Provider stats
 _provider_stats = {
-    "mailtm": {"success": 0, "failures": 0, "cooldown_until": 0},
-    "1secmail": {"success": 0, "failures": 0, "cooldown_until": 0},
-    "mailgw": {"success": 0, "failures": 0, "cooldown_until": 0},
-    "guerrilla": {"success": 0, "failures": 0, "cooldown_until": 0},
-    "tempmail_lol": {"success": 0, "failures": 0, "cooldown_until": 0}
+    "mailtm": {"success": 0, "failures": 0, "throttled": 0},
+    "1secmail": {"success": 0, "failures": 0, "throttled": 0},
+    "mailgw": {"success": 0, "failures": 0, "throttled": 0},
+    "guerrilla": {"success": 0, "failures": 0, "throttled": 0},
+    "tempmail_lol": {"success": 0, "failures": 0, "throttled": 0},
+    "local": {"success": 0, "failures": 0, "throttled": 0}
 }
 
+# Circuit breakers guarding every upstream call
+circuit_breakers = CircuitBreakerRegistry(
+    window_seconds=float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60")),
+    min_calls=int(os.getenv("CIRCUIT_MIN_CALLS", "5")),
+    failure_rate_threshold=float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5")),
+    open_seconds=PROVIDER_COOLDOWN_SECONDS,
+    max_open_seconds=float(os.getenv("CIRCUIT_MAX_OPEN_SECONDS", "900")),
+    half_open_max_calls=int(os.getenv("CIRCUIT_HALF_OPEN_MAX_CALLS", "1")),
+    half_open_successes=int(os.getenv("CIRCUIT_HALF_OPEN_SUCCESSES", "2"))
+)
+
+# Client-side rate budgets: "provider" buckets are shared by all calls, "provider.operation" ones
+# (create/token/list/detail/domains/delete) apply on top. Format: key=rate_per_second/burst
+PROVIDER_RATE_LIMITS = os.getenv(
+    "PROVIDER_RATE_LIMITS",
+    "mailtm=7/8,mailgw=7/8,mailtm.create=1/3,mailgw.create=1/3,1secmail=2/4,guerrilla=2/4"
+)
+provider_rate_limiter = ProviderRateLimiter(
+    parse_rate_limits(PROVIDER_RATE_LIMITS),
+    max_wait=float(os.getenv("PROVIDER_RATE_MAX_WAIT", "2"))
+)
+
+
+
+class ProviderUnavailable(HTTPException):
+    """Call refused locally (rate budget exhausted or circuit open) before reaching the provider"""
+
+
+# Latency-aware provider ranking (EWMA per provider and operation); local refusals are not scored
+provider_scorer = ProviderScorer(
+    alpha=float(os.getenv("PROVIDER_SCORE_ALPHA", "0.3")),
+    decay_half_life=float(os.getenv("PROVIDER_SCORE_HALF_LIFE", "300")),
+    local_errors=(ProviderUnavailable,)
+)
+# Scored per upstream request in provider_request (creation is scored per attempt instead)
+SCORED_OPERATIONS = {"list", "detail"}
+
+# Message bodies never change: cache details locally, bounded by total size
+message_cache = MessageCache(max_bytes=int(os.getenv("MESSAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))))
+
+# Concurrent inbox fetches of the same mailbox share one upstream request
+inbox_flights = SingleFlight("inbox")
+
+# SSE fan-out of poll results (polling itself is owned by the scheduler)
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+WAIT_MAX_TIMEOUT = float(os.getenv("WAIT_MAX_TIMEOUT", "120"))
+inbox_watchers = InboxWatcherHub()
+
 # TTL configuration (minutes)
 EMAIL_TTL_MINUTES = int(os.getenv("EMAIL_TTL_MINUTES", "10"))
 
@@ -148,35 +223,71 @@ class CreateEmailResponse(BaseModel):
     service_name: str
 
 
-class DeleteHistoryRequest(BaseModel):
-    ids: Optional[List[int]] = None
+class BatchCreateEmailRequest(BaseModel):
+    count: int = 10
+    service: Optional[str] = "auto"
+    domain: Optional[str] = None
 
 
-# Helper functions
-def is_provider_in_cooldown(provider: str) -> bool:
-    """Check if provider is in cooldown"""
-    now = datetime.now(timezone.utc).timestamp()
-    stats = _provider_stats.get(provider, {})
-    cooldown_until = stats.get("cooldown_until", 0)
-    
-    if now < cooldown_until:
-        remaining = int(cooldown_until - now)
-        logging.warning(f"⏸️ {provider} is in cooldown (remaining: {remaining}s)")
-        return True
-    return False
+class BatchCreateEmailError(BaseModel):
+    index: int
+    error: str
+
+
+class BatchCreateEmailResponse(BaseModel):
+    requested: int
+    created: List[CreateEmailResponse]
+    errors: List[BatchCreateEmailError]
 
 
-def set_provider_cooldown(provider: str, duration: int):
-    """Set cooldown for a provider"""
-    now = datetime.now(timezone.utc).timestamp()
-    _provider_stats[provider]["cooldown_until"] = now + duration
-    logging.warning(f"🔒 {provider} cooldown set for {duration}s")
+class RefreshEmailsRequest(BaseModel):
+    ids: List[int]
 
 
-def clear_provider_cooldown(provider: str):
-    """Clear cooldown for a provider"""
-    _provider_stats[provider]["cooldown_until"] = 0
-    logging.info(f"🔓 {provider} cooldown cleared")
+class DeleteHistoryRequest(BaseModel):
+    ids: Optional[List[int]] = None
+
+
+# Helper functions
+async def provider_request(provider: str, method: str, url: str, operation: str = "other", **kwargs) -> httpx.Response:
+    """Send a request through the provider's pooled client, within its rate budget and guarded by its circuit breaker"""
+    if not await provider_rate_limiter.acquire(provider, operation):
+        raise ProviderUnavailable(status_code=429, detail=f"{provider} {operation} rate budget exhausted")
+    
+    breaker = circuit_breakers.get(provider)
+    if not breaker.allow():
+        raise ProviderUnavailable(status_code=503, detail=f"{provider} circuit open")
+    
+    started = time.monotonic()
+    try:
+        response = await provider_clients.get(provider).request(method, url, **kwargs)
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    except Exception:
+        breaker.record_failure()
+        if operation in SCORED_OPERATIONS:
+            provider_scorer.record(provider, operation, time.monotonic() - started, ok=False)
+        raise
+    
+    status = response.status_code
+    rate_limited = status == 429 or (provider == "1secmail" and status == 403)
+    if rate_limited:
+        # Rate limited (1secmail answers 403 instead): open immediately
+        breaker.record_failure(trip=True)
+        # Let the other workers back off from this provider right away
+        shared_provider_state.poke()
+    elif status >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    if operation in SCORED_OPERATIONS:
+        # The fetchers below turn errors into empty results, so score the raw outcome here
+        provider_scorer.record(
+            provider, operation, time.monotonic() - started,
+            ok=not rate_limited and status < 500, rate_limited=rate_limited
+        )
+    return response
 
 
 # ============================================
@@ -185,192 +296,142 @@ def clear_provider_cooldown(provider: str):
 
 async def get_mailtm_domains():
     """Get available domains from Mail.tm with caching"""
-    now = datetime.now(timezone.utc).timestamp()
-    cache = _domain_cache["mailtm"]
-    
-    if cache["domains"] and now < cache["expires_at"]:
-        logging.info(f"✅ Using cached Mail.tm domains (TTL: {int(cache['expires_at'] - now)}s)")
-        return cache["domains"]
-    
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.get(f"{MAILTM_BASE_URL}/domains")
-            response.raise_for_status()
-            data = response.json()
-            domains = data.get("hydra:member", [])
-            if domains:
-                domain_list = [d["domain"] for d in domains]
-                cache["domains"] = domain_list
-                cache["expires_at"] = now + DOMAIN_CACHE_TTL
-                logging.info(f"✅ Cached {len(domain_list)} Mail.tm domains")
-                return domain_list
-            return []
-        except Exception as e:
-            logging.error(f"❌ Mail.tm domains error: {e}")
-            if cache["domains"]:
-                logging.warning("⚠️ Using expired cache due to API error")
-                return cache["domains"]
-            return []
+    return await domain_cache.get("mailtm")
+
+
+async def _load_mailtm_domains():
+    """Load the Mail.tm domain list (used by the domain cache)"""
+    response = await provider_request("mailtm", "GET", f"{MAILTM_BASE_URL}/domains", operation="domains")
+    response.raise_for_status()
+    data = response.json()
+    return [d["domain"] for d in data.get("hydra:member", [])]
 
 
 async def create_mailtm_account(address: str, password: str):
     """Create account on Mail.tm"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.post(
-                f"{MAILTM_BASE_URL}/accounts",
-                json={"address": address, "password": password}
-            )
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 429:
-                logging.warning("⚠️ Mail.tm rate limited (429)")
-                raise HTTPException(status_code=429, detail="Mail.tm rate limited")
-            raise
+    try:
+        response = await provider_request(
+            "mailtm", "POST",
+            f"{MAILTM_BASE_URL}/accounts",
+            operation="create",
+            json={"address": address, "password": password}
+        )
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 429:
+            logging.warning("⚠️ Mail.tm rate limited (429)")
+            raise HTTPException(status_code=429, detail="Mail.tm rate limited")
+        raise
 
 
 async def get_mailtm_token(address: str, password: str):
     """Get authentication token from Mail.tm"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.post(
-                f"{MAILTM_BASE_URL}/token",
-                json={"address": address, "password": password}
-            )
-            response.raise_for_status()
-            return response.json()["token"]
-        except Exception as e:
-            logging.error(f"Error getting Mail.tm token: {e}")
-            raise
+    try:
+        response = await provider_request(
+            "mailtm", "POST",
+            f"{MAILTM_BASE_URL}/token",
+            operation="token",
+            json={"address": address, "password": password}
+        )
+        response.raise_for_status()
+        return response.json()["token"]
+    except Exception as e:
+        logging.error(f"Error getting Mail.tm token: {e}")
+        raise
 
 
 async def get_mailtm_messages(token: str):
-    """Get messages from Mail.tm"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.get(
-                f"{MAILTM_BASE_URL}/messages",
-                headers={"Authorization": f"Bearer {token}"}
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data.get("hydra:member", [])
-        except httpx.HTTPStatusError as e:
-            if e.response is not None and e.response.status_code == 401:
-                # Bubble up 401 so caller can refresh token
-                raise HTTPException(status_code=401, detail="mailtm unauthorized")
-            logging.error(f"Error getting Mail.tm messages (HTTP): {e}")
-            return []
-        except Exception as e:
-            logging.error(f"Error getting Mail.tm messages: {e}")
-            return []
+    """Get messages from Mail.tm (None if the fetch failed)"""
+    try:
+        response = await provider_request(
+            "mailtm", "GET",
+            f"{MAILTM_BASE_URL}/messages",
+            operation="list",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        response.raise_for_status()
+        data = response.json()
+        return data.get("hydra:member", [])
+    except ProviderUnavailable:
+        raise
+    except httpx.HTTPStatusError as e:
+        if e.response is not None and e.response.status_code == 401:
+            # Bubble up 401 so caller can refresh token
+            raise HTTPException(status_code=401, detail="mailtm unauthorized")
+        logging.error(f"Error getting Mail.tm messages (HTTP): {e}")
+        return None
+    except Exception as e:
+        logging.error(f"Error getting Mail.tm messages: {e}")
+        return None
 
 
 async def get_mailtm_message_detail(token: str, message_id: str):
     """Get message detail from Mail.tm with proper HTML normalization"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.get(
-                f"{MAILTM_BASE_URL}/messages/{message_id}",
-                headers={"Authorization": f"Bearer {token}"}
-            )
-            response.raise_for_status()
-            data = response.json()
+    try:
+        response = await provider_request(
+            "mailtm", "GET",
+            f"{MAILTM_BASE_URL}/messages/{message_id}",
+            operation="detail",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        response.raise_for_status()
+        data = response.json()
             
-            # Normalize html and text to always be arrays
-            if "html" in data:
-                if isinstance(data["html"], list):
-                    pass
-                elif isinstance(data["html"], str):
-                    data["html"] = [data["html"]] if data["html"] else []
-                else:
-                    data["html"] = []
+        # Normalize html and text to always be arrays
+        if "html" in data:
+            if isinstance(data["html"], list):
+                pass
+            elif isinstance(data["html"], str):
+                data["html"] = [data["html"]] if data["html"] else []
             else:
                 data["html"] = []
+        else:
+            data["html"] = []
             
-            if "text" in data:
-                if isinstance(data["text"], list):
-                    pass
-                elif isinstance(data["text"], str):
-                    data["text"] = [data["text"]] if data["text"] else []
-                else:
-                    data["text"] = []
+        if "text" in data:
+            if isinstance(data["text"], list):
+                pass
+            elif isinstance(data["text"], str):
+                data["text"] = [data["text"]] if data["text"] else []
             else:
                 data["text"] = []
+        else:
+            data["text"] = []
             
-            return data
-        except httpx.HTTPStatusError as e:
-            if e.response is not None and e.response.status_code == 401:
-                raise HTTPException(status_code=401, detail="mailtm unauthorized")
-            logging.error(f"Error getting Mail.tm message detail (HTTP): {e}")
-            return None
-        except Exception as e:
-            logging.error(f"Error getting Mail.tm message detail: {e}")
-            return None
+        return data
+    except ProviderUnavailable:
+        raise
+    except httpx.HTTPStatusError as e:
+        if e.response is not None and e.response.status_code == 401:
+            raise HTTPException(status_code=401, detail="mailtm unauthorized")
+        logging.error(f"Error getting Mail.tm message detail (HTTP): {e}")
+        return None
+    except Exception as e:
+        logging.error(f"Error getting Mail.tm message detail: {e}")
+        return None
 
 
 # ============================================
 # 1secmail Provider Functions
 # ============================================
 
+ONESECMAIL_FALLBACK_DOMAINS = [
+    "1secmail.com", "1secmail.org", "1secmail.net",
+    "wwjmp.com", "esiix.com", "xojxe.com", "yoggm.com"
+]
+
+
 async def get_1secmail_domains():
     """Get available domains from 1secmail with caching and fallback"""
-    now = datetime.now(timezone.utc).timestamp()
-    cache = _domain_cache["1secmail"]
-    
-    if cache["domains"] and now < cache["expires_at"]:
-        logging.info(f"✅ Using cached 1secmail domains (TTL: {int(cache['expires_at'] - now)}s)")
-        return cache["domains"]
-    
-    FALLBACK_DOMAINS = [
-        "1secmail.com", "1secmail.org", "1secmail.net",
-        "wwjmp.com", "esiix.com", "xojxe.com", "yoggm.com"
-    ]
+    return await domain_cache.get("1secmail")
+
+
+async def _load_1secmail_domains():
+    """Load the 1secmail domain list (used by the domain cache)"""
     # Avoid hitting 1secmail domain API (often 403). Use fallbacks immediately.
-    cache["domains"] = FALLBACK_DOMAINS
-    cache["expires_at"] = now + DOMAIN_CACHE_TTL
     logging.info("Using 1secmail fallback domains (skipping API)")
-    return FALLBACK_DOMAINS
-    
-    for attempt in range(RETRY_MAX_ATTEMPTS):
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            try:
-                enhanced_headers = {
-                    **BROWSER_HEADERS,
-                    "Cache-Control": "no-cache",
-                    "Pragma": "no-cache",
-                    "Sec-Fetch-Dest": "empty",
-                    "Sec-Fetch-Mode": "cors",
-                    "Sec-Fetch-Site": "cross-site"
-                }
-                
-                response = await client.get(
-                    f"{ONESECMAIL_BASE_URL}/?action=getDomainList",
-                    headers=enhanced_headers,
-                    follow_redirects=True
-                )
-                response.raise_for_status()
-                domains = response.json()
-                
-                if isinstance(domains, list) and domains:
-                    cache["domains"] = domains
-                    cache["expires_at"] = now + DOMAIN_CACHE_TTL
-                    logging.info(f"✅ Cached {len(domains)} 1secmail domains from API")
-                    return domains
-            except Exception as e:
-                logging.error(f"❌ 1secmail API error (attempt {attempt + 1}): {e}")
-                if attempt < RETRY_MAX_ATTEMPTS - 1:
-                    await asyncio.sleep(RETRY_BASE_DELAY * (2 ** attempt))
-    
-    if cache["domains"]:
-        logging.warning("⚠️ Using expired cache due to API errors")
-        return cache["domains"]
-    
-    logging.warning(f"⚠️ 1secmail API unavailable, using {len(FALLBACK_DOMAINS)} fallback domains")
-    cache["domains"] = FALLBACK_DOMAINS
-    cache["expires_at"] = now + DOMAIN_CACHE_TTL
-    return FALLBACK_DOMAINS
+    return ONESECMAIL_FALLBACK_DOMAINS
 
 
 async def create_1secmail_account(username: str, domain: str):
@@ -385,68 +446,70 @@ async def create_1secmail_account(username: str, domain: str):
 
 
 async def get_1secmail_messages(username: str, domain: str):
-    """Get messages from 1secmail"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.get(
-                f"{ONESECMAIL_BASE_URL}/?action=getMessages&login={username}&domain={domain}",
-                headers=BROWSER_HEADERS
-            )
-            response.raise_for_status()
-            messages = response.json()
-            
-            transformed = []
-            for msg in messages:
-                transformed.append({
-                    "id": str(msg["id"]),
-                    "from": {
-                        "address": msg.get("from", "unknown"),
-                        "name": msg.get("from", "unknown")
-                    },
-                    "subject": msg.get("subject", "No Subject"),
-                    "createdAt": msg.get("date", datetime.now(timezone.utc).isoformat())
-                })
-            return transformed
-        except httpx.HTTPStatusError as e:
-            if e.response is not None and e.response.status_code == 403:
-                set_provider_cooldown("1secmail", PROVIDER_COOLDOWN_SECONDS)
-            logging.error(f"Error getting 1secmail messages (HTTP): {e}")
-            return []
-        except Exception as e:
-            logging.error(f"Error getting 1secmail messages: {e}")
-            return []
-
-
-async def get_1secmail_message_detail(username: str, domain: str, message_id: str):
-    """Get message detail from 1secmail"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.get(
-                f"{ONESECMAIL_BASE_URL}/?action=readMessage&login={username}&domain={domain}&id={message_id}",
-                headers=BROWSER_HEADERS
-            )
-            response.raise_for_status()
-            msg = response.json()
+    """Get messages from 1secmail (None if the fetch failed)"""
+    try:
+        response = await provider_request(
+            "1secmail", "GET",
+            f"{ONESECMAIL_BASE_URL}/?action=getMessages&login={username}&domain={domain}",
+            operation="list",
+            headers=BROWSER_HEADERS
+        )
+        response.raise_for_status()
+        messages = response.json()
             
-            return {
+        transformed = []
+        for msg in messages:
+            transformed.append({
                 "id": str(msg["id"]),
                 "from": {
                     "address": msg.get("from", "unknown"),
                     "name": msg.get("from", "unknown")
                 },
                 "subject": msg.get("subject", "No Subject"),
-                "createdAt": msg.get("date", datetime.now(timezone.utc).isoformat()),
-                "html": [msg.get("htmlBody", "")] if msg.get("htmlBody") else [],
-                "text": [msg.get("textBody", "")] if msg.get("textBody") else []
-            }
-        except httpx.HTTPStatusError as e:
-            if e.response is not None and e.response.status_code == 403:
-                set_provider_cooldown("1secmail", PROVIDER_COOLDOWN_SECONDS)
-            logging.error(f"Error getting 1secmail message detail (HTTP): {e}")
-            return None
-        except Exception as e:
-            logging.error(f"Error getting 1secmail message detail: {e}")
-            return None
+                "createdAt": msg.get("date", datetime.now(timezone.utc).isoformat())
+            })
+        return transformed
+    except ProviderUnavailable:
+        raise
+    except httpx.HTTPStatusError as e:
+        logging.error(f"Error getting 1secmail messages (HTTP): {e}")
+        return None
+    except Exception as e:
+        logging.error(f"Error getting 1secmail messages: {e}")
+        return None
+
+
+async def get_1secmail_message_detail(username: str, domain: str, message_id: str):
+    """Get message detail from 1secmail"""
+    try:
+        response = await provider_request(
+            "1secmail", "GET",
+            f"{ONESECMAIL_BASE_URL}/?action=readMessage&login={username}&domain={domain}&id={message_id}",
+            operation="detail",
+            headers=BROWSER_HEADERS
+        )
+        response.raise_for_status()
+        msg = response.json()
+            
+        return {
+            "id": str(msg["id"]),
+            "from": {
+                "address": msg.get("from", "unknown"),
+                "name": msg.get("from", "unknown")
+            },
+            "subject": msg.get("subject", "No Subject"),
+            "createdAt": msg.get("date", datetime.now(timezone.utc).isoformat()),
+            "html": [msg.get("htmlBody", "")] if msg.get("htmlBody") else [],
+            "text": [msg.get("textBody", "")] if msg.get("textBody") else []
+        }
+    except ProviderUnavailable:
+        raise
+    except httpx.HTTPStatusError as e:
+        logging.error(f"Error getting 1secmail message detail (HTTP): {e}")
+        return None
+    except Exception as e:
+        logging.error(f"Error getting 1secmail message detail: {e}")
+        return None
 
 
 # ============================================
@@ -455,138 +518,133 @@ async def get_1secmail_message_detail(username: str, domain: str, message_id: st
 
 async def get_mailgw_domains():
     """Get available domains from mail.gw with caching"""
-    now = datetime.now(timezone.utc).timestamp()
-    cache = _domain_cache["mailgw"]
-    
-    if cache["domains"] and now < cache["expires_at"]:
-        logging.info(f"✅ Using cached mail.gw domains (TTL: {int(cache['expires_at'] - now)}s)")
-        return cache["domains"]
-    
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.get(f"{MAILGW_BASE_URL}/domains")
-            response.raise_for_status()
-            data = response.json()
-            domains = data.get("hydra:member", [])
-            if domains:
-                domain_list = [d["domain"] for d in domains]
-                cache["domains"] = domain_list
-                cache["expires_at"] = now + DOMAIN_CACHE_TTL
-                logging.info(f"✅ Cached {len(domain_list)} mail.gw domains")
-                return domain_list
-            return []
-        except Exception as e:
-            logging.error(f"❌ Mail.gw domains error: {e}")
-            if cache["domains"]:
-                return cache["domains"]
-            return []
+    return await domain_cache.get("mailgw")
+
+
+async def _load_mailgw_domains():
+    """Load the mail.gw domain list (used by the domain cache)"""
+    response = await provider_request("mailgw", "GET", f"{MAILGW_BASE_URL}/domains", operation="domains")
+    response.raise_for_status()
+    data = response.json()
+    return [d["domain"] for d in data.get("hydra:member", [])]
 
 
 async def create_mailgw_account(address: str, password: str):
     """Create account on mail.gw"""
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            logging.info(f"📧 Creating Mail.gw account: {address}")
-            response = await client.post(
-                f"{MAILGW_BASE_URL}/accounts",
-                json={"address": address, "password": password}
-            )
-            response.raise_for_status()
-            logging.info(f"✅ Mail.gw account created successfully")
-            return response.json()
-        except httpx.TimeoutException as e:
-            logging.error(f"❌ Mail.gw timeout: {str(e)}")
-            raise Exception(f"Mail.gw timeout after 30s")
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 429:
-                logging.warning("⚠️ Mail.gw rate limited (429)")
-                raise HTTPException(status_code=429, detail="Mail.gw rate limited")
-            error_text = e.response.text[:200] if e.response.text else "No error message"
-            logging.error(f"❌ Mail.gw HTTP error: {e.response.status_code} - {error_text}")
-            raise Exception(f"Mail.gw HTTP {e.response.status_code}")
-        except Exception as e:
-            error_msg = str(e) if str(e) else repr(e)
-            logging.error(f"❌ Mail.gw connection error: {error_msg}")
-            raise Exception(f"Mail.gw failed: {error_msg}")
+    try:
+        logging.info(f"📧 Creating Mail.gw account: {address}")
+        response = await provider_request(
+            "mailgw", "POST",
+            f"{MAILGW_BASE_URL}/accounts",
+            operation="create",
+            json={"address": address, "password": password},
+            timeout=MAILGW_CREATE_TIMEOUT
+        )
+        response.raise_for_status()
+        logging.info(f"✅ Mail.gw account created successfully")
+        return response.json()
+    except httpx.TimeoutException as e:
+        logging.error(f"❌ Mail.gw timeout: {str(e)}")
+        raise Exception(f"Mail.gw timeout after {int(MAILGW_CREATE_TIMEOUT)}s")
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 429:
+            logging.warning("⚠️ Mail.gw rate limited (429)")
+            raise HTTPException(status_code=429, detail="Mail.gw rate limited")
+        error_text = e.response.text[:200] if e.response.text else "No error message"
+        logging.error(f"❌ Mail.gw HTTP error: {e.response.status_code} - {error_text}")
+        raise Exception(f"Mail.gw HTTP {e.response.status_code}")
+    except ProviderUnavailable:
+        raise
+    except Exception as e:
+        error_msg = str(e) if str(e) else repr(e)
+        logging.error(f"❌ Mail.gw connection error: {error_msg}")
+        raise Exception(f"Mail.gw failed: {error_msg}")
 
 
 async def get_mailgw_token(address: str, password: str):
     """Get authentication token from mail.gw"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.post(
-                f"{MAILGW_BASE_URL}/token",
-                json={"address": address, "password": password}
-            )
-            response.raise_for_status()
-            return response.json()["token"]
-        except Exception as e:
-            logging.error(f"Error getting mail.gw token: {e}")
-            raise
+    try:
+        response = await provider_request(
+            "mailgw", "POST",
+            f"{MAILGW_BASE_URL}/token",
+            operation="token",
+            json={"address": address, "password": password}
+        )
+        response.raise_for_status()
+        return response.json()["token"]
+    except Exception as e:
+        logging.error(f"Error getting mail.gw token: {e}")
+        raise
 
 
 async def get_mailgw_messages(token: str):
-    """Get messages from mail.gw"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.get(
-                f"{MAILGW_BASE_URL}/messages",
-                headers={"Authorization": f"Bearer {token}"}
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data.get("hydra:member", [])
-        except httpx.HTTPStatusError as e:
-            if e.response is not None and e.response.status_code == 401:
-                raise HTTPException(status_code=401, detail="mailgw unauthorized")
-            logging.error(f"Error getting mail.gw messages (HTTP): {e}")
-            return []
-        except Exception as e:
-            logging.error(f"Error getting mail.gw messages: {e}")
-            return []
+    """Get messages from mail.gw (None if the fetch failed)"""
+    try:
+        response = await provider_request(
+            "mailgw", "GET",
+            f"{MAILGW_BASE_URL}/messages",
+            operation="list",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        response.raise_for_status()
+        data = response.json()
+        return data.get("hydra:member", [])
+    except ProviderUnavailable:
+        raise
+    except httpx.HTTPStatusError as e:
+        if e.response is not None and e.response.status_code == 401:
+            raise HTTPException(status_code=401, detail="mailgw unauthorized")
+        logging.error(f"Error getting mail.gw messages (HTTP): {e}")
+        return None
+    except Exception as e:
+        logging.error(f"Error getting mail.gw messages: {e}")
+        return None
 
 
 async def get_mailgw_message_detail(token: str, message_id: str):
     """Get message detail from mail.gw with proper HTML normalization"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.get(
-                f"{MAILGW_BASE_URL}/messages/{message_id}",
-                headers={"Authorization": f"Bearer {token}"}
-            )
-            response.raise_for_status()
-            data = response.json()
+    try:
+        response = await provider_request(
+            "mailgw", "GET",
+            f"{MAILGW_BASE_URL}/messages/{message_id}",
+            operation="detail",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        response.raise_for_status()
+        data = response.json()
             
-            # Normalize html and text to always be arrays
-            if "html" in data:
-                if isinstance(data["html"], list):
-                    pass
-                elif isinstance(data["html"], str):
-                    data["html"] = [data["html"]] if data["html"] else []
-                else:
-                    data["html"] = []
+        # Normalize html and text to always be arrays
+        if "html" in data:
+            if isinstance(data["html"], list):
+                pass
+            elif isinstance(data["html"], str):
+                data["html"] = [data["html"]] if data["html"] else []
             else:
                 data["html"] = []
+        else:
+            data["html"] = []
             
-            if "text" in data:
-                if isinstance(data["text"], list):
-                    pass
-                elif isinstance(data["text"], str):
-                    data["text"] = [data["text"]] if data["text"] else []
-                else:
-                    data["text"] = []
+        if "text" in data:
+            if isinstance(data["text"], list):
+                pass
+            elif isinstance(data["text"], str):
+                data["text"] = [data["text"]] if data["text"] else []
             else:
                 data["text"] = []
+        else:
+            data["text"] = []
             
-            return data
-        except httpx.HTTPStatusError as e:
-            if e.response is not None and e.response.status_code == 401:
-                raise HTTPException(status_code=401, detail="mailgw unauthorized")
-            logging.error(f"Error getting mail.gw message detail (HTTP): {e}")
-            return None
-        except Exception as e:
-            logging.error(f"Error getting mail.gw message detail: {e}")
-            return None
+        return data
+    except ProviderUnavailable:
+        raise
+    except httpx.HTTPStatusError as e:
+        if e.response is not None and e.response.status_code == 401:
+            raise HTTPException(status_code=401, detail="mailgw unauthorized")
+        logging.error(f"Error getting mail.gw message detail (HTTP): {e}")
+        return None
+    except Exception as e:
+        logging.error(f"Error getting mail.gw message detail: {e}")
+        return None
 
 
 # ============================================
@@ -595,263 +653,468 @@ async def get_mailgw_message_detail(token: str, message_id: str):
 
 async def get_guerrilla_domains():
     """Get available domains from Guerrilla Mail"""
-    now = datetime.now(timezone.utc).timestamp()
-    cache = _domain_cache["guerrilla"]
-    
-    if cache["domains"] and now < cache["expires_at"]:
-        logging.info(f"✅ Using cached Guerrilla domains (TTL: {int(cache['expires_at'] - now)}s)")
-        return cache["domains"]
-    
-    default_domains = ["guerrillamail.com", "guerrillamail.net", "guerrillamail.org", "sharklasers.com", "spam4.me"]
-    cache["domains"] = default_domains
-    cache["expires_at"] = now + DOMAIN_CACHE_TTL
-    logging.info(f"✅ Cached {len(default_domains)} Guerrilla domains")
-    return default_domains
+    return await domain_cache.get("guerrilla")
+
+
+async def _load_guerrilla_domains():
+    """Guerrilla Mail domains are fixed (used by the domain cache)"""
+    return ["guerrillamail.com", "guerrillamail.net", "guerrillamail.org", "sharklasers.com", "spam4.me"]
 
 
 async def create_guerrilla_account(username: str, domain: str):
     """Create Guerrilla Mail account"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.get(
-                f"{GUERRILLA_BASE_URL}?f=set_email_user&email_user={username}&lang=en&site=guerrillamail.com"
-            )
-            response.raise_for_status()
-            data = response.json()
+    try:
+        response = await provider_request(
+            "guerrilla", "GET",
+            f"{GUERRILLA_BASE_URL}?f=set_email_user&email_user={username}&lang=en&site=guerrillamail.com",
+            operation="create"
+        )
+        response.raise_for_status()
+        data = response.json()
             
-            address = data.get("email_addr", f"{username}@{domain}")
-            sid_token = data.get("sid_token", "")
+        address = data.get("email_addr", f"{username}@{domain}")
+        sid_token = data.get("sid_token", "")
             
-            return {
-                "address": address,
-                "password": "no-password",
-                "token": sid_token,
-                "account_id": sid_token
-            }
-        except Exception as e:
-            logging.error(f"Error creating Guerrilla account: {e}")
-            address = f"{username}@{domain}"
-            import uuid
-            return {
-                "address": address,
-                "password": "no-password",
-                "token": str(uuid.uuid4()),
-                "account_id": str(uuid.uuid4())
-            }
+        return {
+            "address": address,
+            "password": "no-password",
+            "token": sid_token,
+            "account_id": sid_token
+        }
+    except ProviderUnavailable:
+        raise
+    except Exception as e:
+        logging.error(f"Error creating Guerrilla account: {e}")
+        address = f"{username}@{domain}"
+        import uuid
+        return {
+            "address": address,
+            "password": "no-password",
+            "token": str(uuid.uuid4()),
+            "account_id": str(uuid.uuid4())
+        }
 
 
 async def get_guerrilla_messages(sid_token: str):
-    """Get messages from Guerrilla Mail"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.get(
-                f"{GUERRILLA_BASE_URL}?f=get_email_list&offset=0&sid_token={sid_token}"
-            )
-            response.raise_for_status()
-            data = response.json()
-            messages = data.get("list", [])
+    """Get messages from Guerrilla Mail (None if the fetch failed)"""
+    try:
+        response = await provider_request(
+            "guerrilla", "GET",
+            f"{GUERRILLA_BASE_URL}?f=get_email_list&offset=0&sid_token={sid_token}",
+            operation="list"
+        )
+        response.raise_for_status()
+        data = response.json()
+        messages = data.get("list", [])
             
-            transformed = []
-            for msg in messages:
-                transformed.append({
-                    "id": str(msg.get("mail_id", "")),
-                    "from": {
-                        "address": msg.get("mail_from", "unknown"),
-                        "name": msg.get("mail_from", "unknown")
-                    },
-                    "subject": msg.get("mail_subject", "No Subject"),
-                    "createdAt": msg.get("mail_timestamp", datetime.now(timezone.utc).isoformat())
-                })
-            return transformed
-        except Exception as e:
-            logging.error(f"Error getting Guerrilla messages: {e}")
-            return []
+        transformed = []
+        for msg in messages:
+            transformed.append({
+                "id": str(msg.get("mail_id", "")),
+                "from": {
+                    "address": msg.get("mail_from", "unknown"),
+                    "name": msg.get("mail_from", "unknown")
+                },
+                "subject": msg.get("mail_subject", "No Subject"),
+                "createdAt": msg.get("mail_timestamp", datetime.now(timezone.utc).isoformat())
+            })
+        return transformed
+    except ProviderUnavailable:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting Guerrilla messages: {e}")
+        return None
 
 
 async def get_guerrilla_message_detail(sid_token: str, message_id: str):
     """Get message detail from Guerrilla Mail - FIXED HTML RENDERING"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.get(
-                f"{GUERRILLA_BASE_URL}?f=fetch_email&email_id={message_id}&sid_token={sid_token}"
-            )
-            response.raise_for_status()
-            data = response.json()
+    try:
+        response = await provider_request(
+            "guerrilla", "GET",
+            f"{GUERRILLA_BASE_URL}?f=fetch_email&email_id={message_id}&sid_token={sid_token}",
+            operation="detail"
+        )
+        response.raise_for_status()
+        data = response.json()
             
-            # CRITICAL FIX: Get mail_body which contains HTML content
-            mail_body = data.get("mail_body", "")
+        # CRITICAL FIX: Get mail_body which contains HTML content
+        mail_body = data.get("mail_body", "")
             
-            # Also check mail_excerpt as fallback
-            if not mail_body:
-                mail_body = data.get("mail_excerpt", "")
+        # Also check mail_excerpt as fallback
+        if not mail_body:
+            mail_body = data.get("mail_excerpt", "")
             
-            # IMPORTANT: Ensure content is returned as array (consistent with other providers)
-            html_content = [mail_body] if mail_body else []
-            text_content = [mail_body] if mail_body else []
+        # IMPORTANT: Ensure content is returned as array (consistent with other providers)
+        html_content = [mail_body] if mail_body else []
+        text_content = [mail_body] if mail_body else []
             
-            logging.info(f"📧 Guerrilla message detail - ID: {message_id}, HTML length: {len(mail_body)}")
+        logging.info(f"📧 Guerrilla message detail - ID: {message_id}, HTML length: {len(mail_body)}")
             
-            return {
-                "id": str(data.get("mail_id", message_id)),
-                "from": {
-                    "address": data.get("mail_from", "unknown"),
-                    "name": data.get("mail_from", "unknown")
-                },
-                "subject": data.get("mail_subject", "No Subject"),
-                "createdAt": data.get("mail_timestamp", datetime.now(timezone.utc).isoformat()),
-                "html": html_content,
-                "text": text_content
-            }
-        except Exception as e:
-            logging.error(f"❌ Error getting Guerrilla message detail: {e}")
-            return None
+        return {
+            "id": str(data.get("mail_id", message_id)),
+            "from": {
+                "address": data.get("mail_from", "unknown"),
+                "name": data.get("mail_from", "unknown")
+            },
+            "subject": data.get("mail_subject", "No Subject"),
+            "createdAt": data.get("mail_timestamp", datetime.now(timezone.utc).isoformat()),
+            "html": html_content,
+            "text": text_content
+        }
+    except ProviderUnavailable:
+        raise
+    except Exception as e:
+        logging.error(f"❌ Error getting Guerrilla message detail: {e}")
+        return None
+
+
+# ============================================
+# Local SMTP Provider Functions (self-hosted domains)
+# ============================================
+
+LOCAL_SMTP_DOMAINS = [d.strip().lower() for d in os.getenv("LOCAL_SMTP_DOMAINS", "").split(",") if d.strip()]
+
+
+async def get_local_domains():
+    """Domains accepted by the built-in SMTP listener (static configuration)"""
+    return LOCAL_SMTP_DOMAINS
+
+
+async def create_local_account(username: str, domain: str):
+    """Local mailboxes need no upstream account"""
+    address = f"{username}@{domain}".lower()
+    return {
+        "address": address,
+        "password": "no-password",
+        "token": address,
+        "account_id": address
+    }
+
+
+async def get_local_messages(address: str):
+    """List messages stored by the SMTP listener for a mailbox"""
+    async with AsyncSessionLocal() as db:
+        rows = (await db.scalars(
+            select(LocalMessage)
+            .where(LocalMessage.mailbox_address == address.lower())
+            .order_by(LocalMessage.received_at.desc())
+        )).all()
+        return [row.to_summary() for row in rows]
+
+
+async def get_local_message_detail(address: str, message_id: str):
+    """Get one stored message for a mailbox"""
+    async with AsyncSessionLocal() as db:
+        row = await db.scalar(select(LocalMessage).where(
+            LocalMessage.mailbox_address == address.lower(),
+            LocalMessage.message_id == message_id
+        ))
+        return row.to_dict() if row else None
+
+
+async def deliver_local_message(recipients: List[str], parsed: dict):
+    """SMTP handler: persist the message, then wake the scheduler for those mailboxes"""
+    await asyncio.to_thread(store_local_message, SessionLocal, LocalMessage, recipients, parsed)
+    logging.info(f"📮 Local message for {', '.join(recipients)}: {parsed['subject']}")
+    # Only wakes this worker's scheduler (the one that took the SMTP session);
+    # other workers pick the message up on their next scheduled poll of the mailbox
+    for address in recipients:
+        polling_scheduler.poll_address(address)
+
+
+local_smtp = LocalSMTPServer(
+    LOCAL_SMTP_DOMAINS,
+    deliver_local_message,
+    host=os.getenv("LOCAL_SMTP_HOST", "127.0.0.1"),
+    port=int(os.getenv("LOCAL_SMTP_PORT", "2525")),
+    max_message_size=int(os.getenv("LOCAL_SMTP_MAX_SIZE", str(10 * 1024 * 1024)))
+)
+
+
+# Circuit state, provider counters and domain lists shared by all workers
+# (SHARED_STATE_BACKEND: "memory" for a single worker, "mysql", or a redis:// URL)
+shared_provider_state = SharedProviderState(
+    create_state_backend(os.getenv("SHARED_STATE_BACKEND", "memory"), AsyncSessionLocal, SharedState.__table__),
+    circuit_breakers,
+    providers=["mailtm", "mailgw", "1secmail", "guerrilla"],
+    counters=_provider_stats,
+    domain_ttl=max(DOMAIN_CACHE_TTL - DOMAIN_CACHE_REFRESH_AHEAD, 30),
+    sync_interval=float(os.getenv("SHARED_STATE_SYNC_INTERVAL", "2")),
+    totals_interval=float(os.getenv("SHARED_STATE_TOTALS_INTERVAL", "30"))
+)
+
+domain_cache.register("mailtm", shared_provider_state.shared_loader("mailtm", _load_mailtm_domains))
+domain_cache.register("mailgw", shared_provider_state.shared_loader("mailgw", _load_mailgw_domains))
+domain_cache.register("1secmail", shared_provider_state.shared_loader("1secmail", _load_1secmail_domains))
+domain_cache.register("guerrilla", shared_provider_state.shared_loader("guerrilla", _load_guerrilla_domains))
+
+# Hot-path column updates (message counts, refreshed tokens) are flushed in bulk
+write_behind = WriteBehindBuffer(
+    AsyncSessionLocal,
+    TempEmail.__table__,
+    flush_interval=float(os.getenv("WRITE_BEHIND_INTERVAL", os.getenv("TOKEN_FLUSH_INTERVAL", "5"))),
+    max_pending=int(os.getenv("WRITE_BEHIND_MAX_PENDING", "500"))
+)
+
+# Proactive JWT refresh for token-based providers
+token_manager = TokenManager(
+    write_behind,
+    fetchers={"mailtm": get_mailtm_token, "mailgw": get_mailgw_token},
+    refresh_ahead=float(os.getenv("TOKEN_REFRESH_AHEAD", "300"))
+)
+
+# Active mailboxes resolved without a DB round trip on the message hot paths
+mailbox_registry = MailboxRegistry(max_size=int(os.getenv("MAILBOX_REGISTRY_SIZE", "10000")))
+token_manager.add_listener(mailbox_registry.invalidate)
 
 
 # ============================================
 # Multi-Provider Email Creation with Failover
 # ============================================
 
-async def create_email_with_failover(username: Optional[str] = None, preferred_service: str = "auto", preferred_domain: Optional[str] = None):
-    """Create email with smart failover between providers"""
+PROVIDER_SERVICE_NAMES = {
+    "mailtm": "Mail.tm",
+    "mailgw": "Mail.gw",
+    "1secmail": "1secmail",
+    "guerrilla": "Guerrilla Mail",
+    "local": "Local SMTP"
+}
+# Local SMTP (when configured) needs no upstream round trip, so it goes first
+AUTO_PROVIDER_ORDER = (["local"] if LOCAL_SMTP_DOMAINS else []) + ["mailtm", "mailgw", "1secmail"]
+
+# auto-race: delay before launching the next provider (0 = launch all at once)
+PROVIDER_HEDGE_DELAY = float(os.getenv("PROVIDER_HEDGE_DELAY", "2"))
+
+
+async def create_provider_account(provider: str, username: str, password: str, preferred_domain: Optional[str] = None):
+    """Create an account on a single provider, recording its latency for ranking"""
+    async with provider_scorer.track(provider, "create"):
+        return await _create_provider_account(provider, username, password, preferred_domain)
+
+
+async def _create_provider_account(provider: str, username: str, password: str, preferred_domain: Optional[str] = None):
+    """Create an account on a single provider (returns None if it has no domains)"""
+    if provider == "mailtm":
+        domains = await get_mailtm_domains()
+        if not domains:
+            return None
+        domain = preferred_domain if preferred_domain in domains else domains[0]
+        address = f"{username}@{domain}"
+        account_data = await create_mailtm_account(address, password)
+        token = await get_mailtm_token(address, password)
+        account_id = account_data["id"]
+    
+    elif provider == "mailgw":
+        domains = await get_mailgw_domains()
+        if not domains:
+            return None
+        domain = preferred_domain if preferred_domain in domains else domains[0]
+        address = f"{username}@{domain}"
+        account_data = await create_mailgw_account(address, password)
+        token = await get_mailgw_token(address, password)
+        account_id = account_data["id"]
+    
+    elif provider == "1secmail":
+        domains = await get_1secmail_domains()
+        if not domains:
+            return None
+        domain = preferred_domain if preferred_domain in domains else domains[0]
+        account_data = await create_1secmail_account(username, domain)
+        address, password, token, account_id = (
+            account_data["address"], account_data["password"], account_data["token"], account_data["account_id"]
+        )
+    
+    elif provider == "guerrilla":
+        domains = await get_guerrilla_domains()
+        if not domains:
+            return None
+        domain = preferred_domain if preferred_domain in domains else domains[0]
+        account_data = await create_guerrilla_account(username, domain)
+        address, password, token, account_id = (
+            account_data["address"], account_data["password"], account_data["token"], account_data["account_id"]
+        )
+    
+    elif provider == "local":
+        domains = await get_local_domains()
+        if not domains:
+            return None
+        domain = preferred_domain if preferred_domain in domains else domains[0]
+        account_data = await create_local_account(username, domain)
+        address, password, token, account_id = (
+            account_data["address"], account_data["password"], account_data["token"], account_data["account_id"]
+        )
+    
+    else:
+        return None
+    
+    return {
+        "address": address,
+        "password": password,
+        "token": token,
+        "account_id": account_id,
+        "provider": provider,
+        "service_name": PROVIDER_SERVICE_NAMES[provider],
+        "username": username,
+        "domain": domain
+    }
+
+
+async def discard_provider_account(account: dict):
+    """Best-effort deletion of an account we created but will not use"""
+    base_urls = {"mailtm": MAILTM_BASE_URL, "mailgw": MAILGW_BASE_URL}
+    provider = account["provider"]
+    if provider not in base_urls:
+        return
+    try:
+        response = await provider_request(
+            provider, "DELETE",
+            f"{base_urls[provider]}/accounts/{account['account_id']}",
+            operation="delete",
+            headers={"Authorization": f"Bearer {account['token']}"}
+        )
+        response.raise_for_status()
+        logging.info(f"🧹 Discarded unused {provider} account: {account['address']}")
+    except Exception as e:
+        logging.warning(f"⚠️ Could not discard {provider} account {account['address']}: {e}")
+
+
+def record_provider_success(provider: str, account: dict):
+    """Update stats after a successful account creation"""
+    _provider_stats[provider]["success"] += 1
+    logging.info(f"✅ {PROVIDER_SERVICE_NAMES[provider]} email created: {account['address']}")
+
+
+def record_provider_failure(provider: str, error: Exception, errors: List[str]):
+    """Update stats after a failed account creation (the circuit breaker already saw the call)"""
+    if isinstance(error, ProviderUnavailable):
+        # Refused by our own rate budget / open circuit: the provider never saw the call
+        _provider_stats[provider]["throttled"] += 1
+        errors.append(f"{provider}: {error.detail}")
+    elif isinstance(error, HTTPException):
+        if error.status_code == 429:
+            _provider_stats[provider]["failures"] += 1
+            errors.append(f"{provider}: rate limited")
+        else:
+            errors.append(f"{provider}: {str(error)}")
+    else:
+        logging.error(f"❌ {provider} failed: {error}")
+        _provider_stats[provider]["failures"] += 1
+        errors.append(f"{provider}: {str(error)}")
+
+
+async def race_providers(candidates: List[str], username: str, password: str, preferred_domain: Optional[str], errors: List[str]):
+    """Hedged creation: start providers PROVIDER_HEDGE_DELAY apart, keep the first success"""
+    remaining = list(candidates)
+    pending = {}
+    winner = None
+    
+    def launch():
+        provider = remaining.pop(0)
+        logging.info(f"🏁 Racing {provider}...")
+        task = asyncio.create_task(create_provider_account(provider, username, password, preferred_domain))
+        pending[task] = provider
+    
+    launch()
+    while remaining and PROVIDER_HEDGE_DELAY <= 0:
+        launch()
+    
+    try:
+        while pending and winner is None:
+            done, _ = await asyncio.wait(
+                pending,
+                timeout=PROVIDER_HEDGE_DELAY if remaining else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                # Hedge delay elapsed without an answer: start the next provider
+                launch()
+                continue
+            
+            for task in done:
+                provider = pending.pop(task)
+                try:
+                    account = task.result()
+                except Exception as e:
+                    record_provider_failure(provider, e, errors)
+                    continue
+                if account is None:
+                    continue
+                if winner is None:
+                    winner = account
+                    record_provider_success(provider, account)
+                else:
+                    asyncio.create_task(discard_provider_account(account))
+            
+            if winner is None and remaining and not pending:
+                # Everything in flight failed fast: don't wait out the hedge delay
+                launch()
+    finally:
+        losers = list(pending)
+        for task in losers:
+            task.cancel()
+        results = await asyncio.gather(*losers, return_exceptions=True)
+        for account in results:
+            if isinstance(account, dict):
+                asyncio.create_task(discard_provider_account(account))
+    
+    return winner
+
+
+async def create_email_with_failover(
+    username: Optional[str] = None,
+    preferred_service: str = "auto",
+    preferred_domain: Optional[str] = None,
+    provider_limits: Optional[dict] = None
+):
+    """Create email with smart failover between providers
+    
+    provider_limits optionally maps provider -> asyncio.Semaphore bounding concurrent creates.
+    """
     
     # Normalize/sanitize username input (avoid Swagger default 'string')
     username = sanitize_username(username)
     
     password = ''.join(random.choices(string.ascii_letters + string.digits, k=16))
     
-    if preferred_service == "mailtm":
-        providers_to_try = ["mailtm"]
-    elif preferred_service == "1secmail":
-        providers_to_try = ["1secmail"]
-    elif preferred_service == "mailgw":
-        providers_to_try = ["mailgw"]
-    elif preferred_service == "guerrilla":
-        providers_to_try = ["guerrilla"]
+    if preferred_service in PROVIDER_SERVICE_NAMES:
+        providers_to_try = [preferred_service]
     else:
-        # Auto mode: try all providers in random order (removed guerrilla)
-        providers_to_try = ["mailtm", "mailgw", "1secmail"]
-        logging.info(f"🎲 Random provider order: {providers_to_try}")
+        # Auto mode: fastest expected provider first (removed guerrilla)
+        providers_to_try = provider_scorer.rank(AUTO_PROVIDER_ORDER, "create")
+        logging.info(f"🎲 Provider order: {providers_to_try}")
     
     errors = []
     skipped_providers = []
+    candidates = []
     
     for provider in providers_to_try:
-        if is_provider_in_cooldown(provider):
+        if not circuit_breakers.get(provider).available():
             skipped_providers.append(provider)
-            logging.info(f"⏭️ Skipping {provider} (in cooldown)")
+            logging.info(f"⏭️ Skipping {provider} (circuit open)")
             continue
-        
-        try:
-            logging.info(f"🔄 Trying {provider}...")
-            
-            if provider == "mailtm":
-                domains = await get_mailtm_domains()
-                if not domains:
-                    continue
-                domain = preferred_domain if preferred_domain in domains else domains[0]
-                address = f"{username}@{domain}"
-                account_data = await create_mailtm_account(address, password)
-                token = await get_mailtm_token(address, password)
-                
-                clear_provider_cooldown(provider)
-                _provider_stats[provider]["success"] += 1
-                logging.info(f"✅ Mail.tm email created: {address}")
-                
-                return {
-                    "address": address,
-                    "password": password,
-                    "token": token,
-                    "account_id": account_data["id"],
-                    "provider": "mailtm",
-                    "service_name": "Mail.tm",
-                    "username": username,
-                    "domain": domain
-                }
-            
-            elif provider == "mailgw":
-                domains = await get_mailgw_domains()
-                if not domains:
-                    continue
-                domain = preferred_domain if preferred_domain in domains else domains[0]
-                address = f"{username}@{domain}"
-                account_data = await create_mailgw_account(address, password)
-                token = await get_mailgw_token(address, password)
-                
-                clear_provider_cooldown(provider)
-                _provider_stats[provider]["success"] += 1
-                logging.info(f"✅ Mail.gw email created: {address}")
-                
-                return {
-                    "address": address,
-                    "password": password,
-                    "token": token,
-                    "account_id": account_data["id"],
-                    "provider": "mailgw",
-                    "service_name": "Mail.gw",
-                    "username": username,
-                    "domain": domain
-                }
-            
-            elif provider == "1secmail":
-                domains = await get_1secmail_domains()
-                if not domains:
-                    continue
-                domain = preferred_domain if preferred_domain in domains else domains[0]
-                account_data = await create_1secmail_account(username, domain)
-                
-                clear_provider_cooldown(provider)
-                _provider_stats[provider]["success"] += 1
-                logging.info(f"✅ 1secmail email created: {account_data['address']}")
-                
-                return {
-                    "address": account_data["address"],
-                    "password": account_data["password"],
-                    "token": account_data["token"],
-                    "account_id": account_data["account_id"],
-                    "provider": "1secmail",
-                    "service_name": "1secmail",
-                    "username": username,
-                    "domain": domain
-                }
-            
-            elif provider == "guerrilla":
-                domains = await get_guerrilla_domains()
-                if not domains:
-                    continue
-                domain = preferred_domain if preferred_domain in domains else domains[0]
-                account_data = await create_guerrilla_account(username, domain)
-                
-                clear_provider_cooldown(provider)
-                _provider_stats[provider]["success"] += 1
-                logging.info(f"✅ Guerrilla email created: {account_data['address']}")
-                
-                return {
-                    "address": account_data["address"],
-                    "password": account_data["password"],
-                    "token": account_data["token"],
-                    "account_id": account_data["account_id"],
-                    "provider": "guerrilla",
-                    "service_name": "Guerrilla Mail",
-                    "username": username,
-                    "domain": domain
-                }
-                
-        except HTTPException as e:
-            if e.status_code == 429:
-                set_provider_cooldown(provider, PROVIDER_COOLDOWN_SECONDS)
-                _provider_stats[provider]["failures"] += 1
-                errors.append(f"{provider}: rate limited")
-            else:
-                errors.append(f"{provider}: {str(e)}")
-        except Exception as e:
-            logging.error(f"❌ {provider} failed: {e}")
-            _provider_stats[provider]["failures"] += 1
-            errors.append(f"{provider}: {str(e)}")
+        candidates.append(provider)
+    
+    if preferred_service == "auto-race" and len(candidates) > 1:
+        account = await race_providers(candidates, username, password, preferred_domain, errors)
+        if account:
+            return account
+    else:
+        for provider in candidates:
+            try:
+                logging.info(f"🔄 Trying {provider}...")
+                limit = provider_limits.get(provider) if provider_limits else None
+                async with limit or nullcontext():
+                    account = await create_provider_account(provider, username, password, preferred_domain)
+                if account:
+                    record_provider_success(provider, account)
+                    return account
+            except Exception as e:
+                record_provider_failure(provider, e, errors)
     
     # Build detailed error message
     error_parts = []
     if skipped_providers:
-        error_parts.append(f"Providers in cooldown: {', '.join(skipped_providers)}")
+        error_parts.append(f"Providers unavailable (circuit open): {', '.join(skipped_providers)}")
     if errors:
         error_parts.append(f"Errors: {', '.join(errors)}")
     
@@ -867,6 +1130,42 @@ async def create_email_with_failover(username: Optional[str] = None, preferred_s
     )
 
 
+# ============================================
+# Warm Mailbox Pool
+# ============================================
+
+async def _create_pool_account(provider: str):
+    """Create a random-username account for the warm mailbox pool"""
+    password = ''.join(random.choices(string.ascii_letters + string.digits, k=16))
+    return await create_provider_account(provider, sanitize_username(None), password)
+
+
+mailbox_pool = MailboxPool(
+    providers=[p.strip() for p in os.getenv("MAILBOX_POOL_PROVIDERS", "mailtm,mailgw").split(",") if p.strip()],
+    factory=_create_pool_account,
+    discarder=discard_provider_account,
+    low_watermark=int(os.getenv("MAILBOX_POOL_LOW", "2")),
+    high_watermark=int(os.getenv("MAILBOX_POOL_HIGH", "5")),
+    max_age=float(os.getenv("MAILBOX_POOL_MAX_AGE", "600")),
+    refill_concurrency=int(os.getenv("MAILBOX_POOL_CONCURRENCY", "2"))
+)
+
+
+def take_pooled_account(preferred_service: str = "auto", preferred_domain: Optional[str] = None):
+    """Hand out a pre-created account matching the request, or None"""
+    if preferred_service in PROVIDER_SERVICE_NAMES:
+        candidates = [preferred_service]
+    else:
+        candidates = provider_scorer.rank(AUTO_PROVIDER_ORDER, "create")
+    
+    for provider in candidates:
+        account = mailbox_pool.take(provider, preferred_domain)
+        if account:
+            logging.info(f"🏊 Using pooled {provider} account: {account['address']}")
+            return account
+    return None
+
+
 # ============================================
 # API Routes
 # ============================================
@@ -874,14 +1173,14 @@ async def create_email_with_failover(username: Optional[str] = None, preferred_s
 @api_router.get("/")
 async def root():
     """API root with provider status"""
-    now = datetime.now(timezone.utc).timestamp()
-    
     for provider in _provider_stats:
         stats = _provider_stats[provider]
-        cooldown_until = stats.get("cooldown_until", 0)
+        circuit = circuit_breakers.get(provider).snapshot()
         
-        if now < cooldown_until:
-            stats["status"] = f"cooldown ({int(cooldown_until - now)}s remaining)"
+        if circuit["state"] == "open":
+            stats["status"] = f"cooldown ({circuit['open_remaining']}s remaining)"
+        elif circuit["state"] == "half_open":
+            stats["status"] = "half-open (probing)"
         else:
             stats["status"] = "active"
         
@@ -893,25 +1192,50 @@ async def root():
     
     return {
         "message": "TempMail API - MySQL with Multiple Providers",
-        "providers": ["Mail.tm", "Mail.gw", "1secmail", "Guerrilla Mail"],
+        "providers": ["Mail.tm", "Mail.gw", "1secmail", "Guerrilla Mail"] + (["Local SMTP"] if LOCAL_SMTP_DOMAINS else []),
         "stats": _provider_stats,
+        "fleet_stats": shared_provider_state.fleet_stats(),
         "config": {
             "provider_cooldown": f"{PROVIDER_COOLDOWN_SECONDS}s",
             "retry_attempts": RETRY_MAX_ATTEMPTS,
-            "domain_cache_ttl": f"{DOMAIN_CACHE_TTL}s"
-        }
+            "domain_cache_ttl": f"{DOMAIN_CACHE_TTL}s",
+            "provider_hedge_delay": f"{PROVIDER_HEDGE_DELAY}s"
+        },
+        "http_pools": provider_clients.stats(),
+        "inbox_single_flight": inbox_flights.stats(),
+        "domain_cache": domain_cache.stats(),
+        "scores": provider_scorer.snapshot(),
+        "rate_limits": provider_rate_limiter.stats(),
+        "circuits": circuit_breakers.snapshot(),
+        "tokens": token_manager.stats(),
+        "write_behind": write_behind.stats(),
+        "mailbox_registry": mailbox_registry.stats(),
+        "admission": admission.stats(),
+        "shared_state": shared_provider_state.stats(),
+        "mailbox_pool": mailbox_pool.stats(),
+        "message_cache": message_cache.stats(),
+        "inbox_streams": inbox_watchers.stats(),
+        "polling_scheduler": polling_scheduler.stats(),
+        "local_smtp": local_smtp.stats(),
+        "expiry_sweeps": _expiry_stats
     }
 
 
 @api_router.post("/emails/create", response_model=CreateEmailResponse)
-async def create_email(request: CreateEmailRequest, db: Session = Depends(get_db)):
+async def create_email(request: CreateEmailRequest, db: AsyncSession = Depends(get_async_db)):
     """Create a new temporary email with automatic provider failover"""
     try:
-        email_data = await create_email_with_failover(
-            username=request.username,
-            preferred_service=request.service or "auto",
-            preferred_domain=request.domain
-        )
+        email_data = None
+        # Random usernames can come straight from the warm pool
+        if not request.username or request.username.strip().lower() == "string":
+            email_data = take_pooled_account(request.service or "auto", request.domain)
+        
+        if email_data is None:
+            email_data = await create_email_with_failover(
+                username=request.username,
+                preferred_service=request.service or "auto",
+                preferred_domain=request.domain
+            )
         
         # Use naive UTC consistently for MySQL DATETIME
         now = datetime.utcnow()
@@ -931,10 +1255,11 @@ async def create_email(request: CreateEmailRequest, db: Session = Depends(get_db
         )
         
         db.add(email_doc)
-        db.commit()
-        db.refresh(email_doc)
+        await db.commit()
+        await db.refresh(email_doc)
         
         logging.info(f"✅ Email created: {email_doc.address} (Provider: {email_doc.provider})")
+        polling_scheduler.track(mailbox_registry.put(email_doc))
         
         return CreateEmailResponse(
             id=email_doc.id,
@@ -948,62 +1273,216 @@ async def create_email(request: CreateEmailRequest, db: Session = Depends(get_db
         raise
     except Exception as e:
         logging.error(f"❌ Error creating email: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to create email: {str(e)}")
 
 
-@api_router.get("/emails", response_model=List[TempEmailSchema])
-async def get_emails(db: Session = Depends(get_db)):
-    """Get all temporary emails"""
-    emails = db.query(TempEmail).order_by(TempEmail.created_at.desc()).all()
-    return [TempEmailSchema(**email.to_dict()) for email in emails]
+BATCH_CREATE_MAX = int(os.getenv("BATCH_CREATE_MAX", "500"))
+BATCH_CREATE_PROVIDER_CONCURRENCY = int(os.getenv("BATCH_CREATE_PROVIDER_CONCURRENCY", "5"))
+# Shared across batches so concurrent batch requests cannot gang up on one provider
+_batch_create_limits = {
+    provider: asyncio.Semaphore(BATCH_CREATE_PROVIDER_CONCURRENCY) for provider in PROVIDER_SERVICE_NAMES
+}
+
+
+async def _create_batch_account(service: str, domain: Optional[str]):
+    """One batch slot: warm pool first, then failover under the per-provider limits"""
+    account = take_pooled_account(service, domain)
+    if account is None:
+        account = await create_email_with_failover(
+            preferred_service="auto" if service == "auto-race" else service,
+            preferred_domain=domain,
+            provider_limits=_batch_create_limits
+        )
+    return account
+
+
+@api_router.post("/emails/create/batch", response_model=BatchCreateEmailResponse)
+async def create_email_batch(
+    request: BatchCreateEmailRequest,
+    http_request: Request,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create many random temporary emails at once; returns partial results plus per-item errors"""
+    # A batch larger than the per-client batch budget could never be admitted: 400, not a retryable 429
+    max_count = min(BATCH_CREATE_MAX, admission.batch_limit)
+    if request.count < 1 or request.count > max_count:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {max_count}")
+    
+    # Each requested mailbox counts against the client's batch creation budget
+    allowed, retry_after = await admission.check_rate(
+        admission.client_key(http_request.scope), cost=request.count, batch=True
+    )
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many batch create requests, slow down",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+    
+    service = request.service or "auto"
+    results = await asyncio.gather(
+        *(_create_batch_account(service, request.domain) for _ in range(request.count)),
+        return_exceptions=True
+    )
+    
+    accounts = {}
+    errors = []
+    for index, result in enumerate(results):
+        if isinstance(result, HTTPException):
+            errors.append(BatchCreateEmailError(index=index, error=str(result.detail)))
+        elif isinstance(result, BaseException):
+            errors.append(BatchCreateEmailError(index=index, error=str(result)))
+        else:
+            accounts[index] = result
+    
+    created = []
+    if accounts:
+        now = datetime.utcnow()
+        expires_at = now + timedelta(minutes=EMAIL_TTL_MINUTES)
+        rows = {
+            index: {
+                "address": account["address"],
+                "password": account["password"],
+                "token": account["token"],
+                "account_id": account["account_id"],
+                "created_at": now,
+                "expires_at": expires_at,
+                "message_count": 0,
+                "provider": account["provider"],
+                "username": account["username"],
+                "domain": account["domain"]
+            }
+            for index, account in accounts.items()
+        }
+        try:
+            # One multi-row INSERT for the whole batch, then read the ids back by address
+            await db.execute(insert(TempEmail), list(rows.values()))
+            await db.commit()
+        except Exception as e:
+            # A single bad row (e.g. a duplicate address) fails the whole statement:
+            # save rows one by one so the rest of the batch still lands
+            logging.warning(f"⚠️ Bulk insert of email batch failed, saving rows individually: {e}")
+            await db.rollback()
+            for index, row in rows.items():
+                try:
+                    await db.execute(insert(TempEmail), [row])
+                    await db.commit()
+                except Exception as row_error:
+                    await db.rollback()
+                    logging.error(f"❌ Error saving batch email {row['address']}: {row_error}")
+                    errors.append(BatchCreateEmailError(index=index, error=f"Failed to save email: {row_error}"))
+                    asyncio.create_task(discard_provider_account(accounts.pop(index)))
+            errors.sort(key=lambda error: error.index)
+        
+        service_names = {account["address"]: account["service_name"] for account in accounts.values()}
+        email_docs = (await db.scalars(select(TempEmail).where(TempEmail.address.in_(list(service_names))))).all()
+        for email_doc in email_docs:
+            polling_scheduler.track(mailbox_registry.put(email_doc))
+            email_dict = email_doc.to_dict()
+            created.append(CreateEmailResponse(
+                id=email_doc.id,
+                address=email_doc.address,
+                created_at=email_dict["created_at"],
+                expires_at=email_dict["expires_at"],
+                provider=email_doc.provider,
+                service_name=service_names[email_doc.address]
+            ))
+    
+    logging.info(f"📦 Batch created {len(created)}/{request.count} emails ({len(errors)} errors)")
+    return BatchCreateEmailResponse(requested=request.count, created=created, errors=errors)
+
+
+LIST_MAX_LIMIT = int(os.getenv("LIST_MAX_LIMIT", "500"))
+
+
+async def paginated_list(response: Response, db, stmt, sort_column, id_column, limit, cursor, fields, allowed_fields, serialize):
+    """Keyset-paginate a list query and project its items; the next cursor goes in X-Next-Cursor"""
+    try:
+        selected = parse_fields(fields, allowed_fields)
+        rows, next_cursor = await keyset_page(db, stmt, sort_column, id_column, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return project([serialize(row) for row in rows], selected)
+
+
+@api_router.get("/emails")
+async def get_emails(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get temporary emails, newest first (pass limit/cursor to paginate, fields=a,b to project)"""
+    return await paginated_list(
+        response, db, select(TempEmail), TempEmail.created_at, TempEmail.id, limit, cursor, fields,
+        TempEmailSchema.model_fields, lambda email: TempEmailSchema(**email.to_dict()).model_dump()
+    )
 
 
 @api_router.get("/emails/{email_id}")
-async def get_email(email_id: int, db: Session = Depends(get_db)):
+async def get_email(email_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get email by ID"""
-    email = db.query(TempEmail).filter(TempEmail.id == email_id).first()
+    email = await db.scalar(select(TempEmail).where(TempEmail.id == email_id))
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     return email.to_dict()
 
 
-@api_router.get("/emails/{email_id}/messages")
-async def get_email_messages(email_id: int, db: Session = Depends(get_db)):
-    """Get messages for an email"""
-    email = db.query(TempEmail).filter(TempEmail.id == email_id).first()
-    if not email:
-        raise HTTPException(status_code=404, detail="Email not found")
-    
+async def resolve_mailbox(db, email_id: int):
+    """Active mailbox by id: registry first, else one DB lookup that repopulates it"""
+    email = mailbox_registry.get(email_id)
+    if email is None:
+        row = await db.scalar(select(TempEmail).where(TempEmail.id == email_id))
+        if not row:
+            raise HTTPException(status_code=404, detail="Email not found")
+        email = mailbox_registry.put(row)
+    return email
+
+
+async def fetch_mailbox_messages(email):
+    """Fetch a mailbox's messages, coalescing concurrent fetches of the same inbox"""
+    key = (email.provider, email.address)
+    return await inbox_flights.do(key, lambda: _fetch_mailbox_messages(email))
+
+
+async def _fetch_mailbox_messages(email):
+    """Fetch messages from the mailbox's provider (refreshing the token once on 401)"""
     provider = email.provider
     
     if provider == "mailtm":
+        token = await token_manager.get_token(email)
         try:
-            messages = await get_mailtm_messages(email.token)
+            messages = await get_mailtm_messages(token)
         except HTTPException as e:
             if e.status_code == 401:
-                # Refresh token and retry once
+                # Token revoked before its expiry: refresh and retry once
                 try:
-                    new_token = await get_mailtm_token(email.address, email.password)
-                    email.token = new_token
-                    db.commit()
+                    new_token = await token_manager.refresh(email)
                     messages = await get_mailtm_messages(new_token)
+                except ProviderUnavailable:
+                    raise
                 except Exception:
-                    messages = []
+                    messages = None
             else:
                 raise
     elif provider == "mailgw":
+        token = await token_manager.get_token(email)
         try:
-            messages = await get_mailgw_messages(email.token)
+            messages = await get_mailgw_messages(token)
         except HTTPException as e:
             if e.status_code == 401:
+                # Token revoked before its expiry: refresh and retry once
                 try:
-                    new_token = await get_mailgw_token(email.address, email.password)
-                    email.token = new_token
-                    db.commit()
+                    new_token = await token_manager.refresh(email)
                     messages = await get_mailgw_messages(new_token)
+                except ProviderUnavailable:
+                    raise
                 except Exception:
-                    messages = []
+                    messages = None
             else:
                 raise
     elif provider == "1secmail":
@@ -1012,48 +1491,113 @@ async def get_email_messages(email_id: int, db: Session = Depends(get_db)):
         messages = await get_1secmail_messages(username, domain)
     elif provider == "guerrilla":
         messages = await get_guerrilla_messages(email.token)
+    elif provider == "local":
+        messages = await get_local_messages(email.address)
     else:
         messages = []
     
+    if messages is None:
+        # Failed upstream fetch: never pass it off as an empty inbox
+        raise HTTPException(status_code=502, detail=f"Could not fetch messages from {provider}")
+    return messages
+
+
+SCHEDULER_MAX_MAILBOXES = int(os.getenv("SCHEDULER_MAX_MAILBOXES", "1000"))
+
+
+def _load_active_mailboxes():
+    """Active mailboxes the scheduler should own (newest first)"""
+    db = SessionLocal()
+    try:
+        return db.query(TempEmail).order_by(TempEmail.created_at.desc()).limit(SCHEDULER_MAX_MAILBOXES).all()
+    finally:
+        db.close()
+
+
+def _parse_budgets(raw: str):
+    """Parse "mailtm=2,mailgw=1.5" into {"mailtm": 2.0, "mailgw": 1.5}"""
+    budgets = {}
+    for part in raw.split(","):
+        if "=" in part:
+            provider, rate = part.split("=", 1)
+            budgets[provider.strip()] = float(rate)
+    return budgets
+
+
+polling_scheduler = PollingScheduler(
+    fetch=fetch_mailbox_messages,
+    loader=_load_active_mailboxes,
+    min_interval=float(os.getenv("SCHEDULER_MIN_INTERVAL", "5")),
+    max_interval=float(os.getenv("SCHEDULER_MAX_INTERVAL", "300")),
+    watched_max_interval=float(os.getenv("SCHEDULER_WATCHED_MAX_INTERVAL", "15")),
+    budgets=_parse_budgets(os.getenv("SCHEDULER_PROVIDER_BUDGETS", "")),
+    default_budget=float(os.getenv("SCHEDULER_DEFAULT_BUDGET", "2")),
+    max_concurrency=int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "10"))
+)
+polling_scheduler.add_listener(inbox_watchers.publish)
+
+
+# Client reads are served from the scheduler's last poll while it is at most this old
+MESSAGES_MAX_AGE = float(os.getenv("MESSAGES_MAX_AGE", "20"))
+REFRESH_MAX_AGE = float(os.getenv("REFRESH_MAX_AGE", "5"))
+
+
+@api_router.get("/emails/{email_id}/messages")
+async def get_email_messages(email_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Get messages for an email"""
+    email = await resolve_mailbox(db, email_id)
+    
+    messages = await polling_scheduler.read(email, MESSAGES_MAX_AGE)
+    
+    write_behind.set(email.id, current=email, message_count=len(messages))
     email.message_count = len(messages)
-    db.commit()
     
     return {"messages": messages, "count": len(messages)}
 
 
-@api_router.get("/emails/{email_id}/messages/{message_id}")
-async def get_message_detail(email_id: int, message_id: str, db: Session = Depends(get_db)):
-    """Get message detail"""
-    email = db.query(TempEmail).filter(TempEmail.id == email_id).first()
-    if not email:
-        raise HTTPException(status_code=404, detail="Email not found")
-    
+async def fetch_message_detail(email, message_id: str):
+    """Get a message detail, served from the local cache when it was fetched before"""
+    key = (email.provider, email.address, message_id)
+    message = message_cache.get(key)
+    if message is None:
+        message = await _fetch_message_detail(email, message_id)
+        if message:
+            message_cache.put(key, message)
+    return message
+
+
+async def _fetch_message_detail(email, message_id: str):
+    """Fetch one message from the mailbox's provider (refreshing the token once on 401)"""
     provider = email.provider
     
     if provider == "mailtm":
+        token = await token_manager.get_token(email)
         try:
-            message = await get_mailtm_message_detail(email.token, message_id)
+            message = await get_mailtm_message_detail(token, message_id)
         except HTTPException as e:
             if e.status_code == 401:
+                # Token revoked before its expiry: refresh and retry once
                 try:
-                    new_token = await get_mailtm_token(email.address, email.password)
-                    email.token = new_token
-                    db.commit()
+                    new_token = await token_manager.refresh(email)
                     message = await get_mailtm_message_detail(new_token, message_id)
+                except ProviderUnavailable:
+                    raise
                 except Exception:
                     message = None
             else:
                 raise
     elif provider == "mailgw":
+        token = await token_manager.get_token(email)
         try:
-            message = await get_mailgw_message_detail(email.token, message_id)
+            message = await get_mailgw_message_detail(token, message_id)
         except HTTPException as e:
             if e.status_code == 401:
+                # Token revoked before its expiry: refresh and retry once
                 try:
-                    new_token = await get_mailgw_token(email.address, email.password)
-                    email.token = new_token
-                    db.commit()
+                    new_token = await token_manager.refresh(email)
                     message = await get_mailgw_message_detail(new_token, message_id)
+                except ProviderUnavailable:
+                    raise
                 except Exception:
                     message = None
             else:
@@ -1064,9 +1608,120 @@ async def get_message_detail(email_id: int, message_id: str, db: Session = Depen
         message = await get_1secmail_message_detail(username, domain, message_id)
     elif provider == "guerrilla":
         message = await get_guerrilla_message_detail(email.token, message_id)
+    elif provider == "local":
+        message = await get_local_message_detail(email.address, message_id)
     else:
         message = None
     
+    return message
+
+
+def _parse_message_time(value) -> Optional[datetime]:
+    """Parse a provider createdAt value into an aware UTC datetime (None if unparseable)"""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _message_matches(message: dict, sender: Optional[str], subject: Optional[str]) -> bool:
+    """Case-insensitive substring filters on sender address/name and subject"""
+    if sender:
+        sender_info = message.get("from")
+        if isinstance(sender_info, dict):
+            sender_text = f"{sender_info.get('address', '')} {sender_info.get('name', '')}"
+        else:
+            sender_text = str(sender_info or "")
+        if sender.lower() not in sender_text.lower():
+            return False
+    if subject and subject.lower() not in str(message.get("subject") or "").lower():
+        return False
+    return True
+
+
+@api_router.get("/emails/{email_id}/messages/wait")
+async def wait_for_messages(
+    email_id: int,
+    timeout: float = 30,
+    since: Optional[str] = None,
+    sender: Optional[str] = None,
+    subject: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Long-poll until a new message (optionally filtered by sender/subject) arrives.
+    
+    Without ``since`` only messages arriving after the call count; with an ISO
+    ``since`` timestamp, messages already in the inbox that are newer also match.
+    All waiters of a mailbox share the scheduler's single upstream poller.
+    """
+    email = await resolve_mailbox(db, email_id)
+    # Return the pooled connection now rather than holding it for the whole wait
+    await db.close()
+    
+    since_dt = _parse_message_time(since) if since else None
+    if since and since_dt is None:
+        raise HTTPException(status_code=400, detail="Invalid 'since' timestamp")
+    timeout = max(0.0, min(timeout, WAIT_MAX_TIMEOUT))
+    
+    polling_scheduler.track(email)
+    # Inbox as known before the call: a snapshot is diffed against it, so mail
+    # landing before the first scheduled poll still counts as new
+    latest = polling_scheduler.latest(email_id)
+    known_ids = {str(m.get("id")) for m in latest[0]} if latest else None
+    queue = inbox_watchers.subscribe(email_id)
+    polling_scheduler.watch(email_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return {"messages": [], "count": 0, "timed_out": True}
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                continue
+            
+            if event["type"] == "snapshot":
+                messages = event["data"]["messages"]
+                if since_dt is None:
+                    snapshot_ids = {str(m.get("id")) for m in messages}
+                    if known_ids is None:
+                        # Nothing polled before the call: this snapshot is the baseline
+                        known_ids = snapshot_ids
+                        continue
+                    candidates = [m for m in messages if str(m.get("id")) not in known_ids]
+                    known_ids |= snapshot_ids
+                else:
+                    candidates = []
+                    for message in messages:
+                        created_at = _parse_message_time(message.get("createdAt"))
+                        if created_at and created_at > since_dt:
+                            candidates.append(message)
+            else:
+                candidates = [event["data"]]
+            
+            matches = [m for m in candidates if _message_matches(m, sender, subject)]
+            if matches:
+                return {"messages": matches, "count": len(matches), "timed_out": False}
+    finally:
+        polling_scheduler.unwatch(email_id)
+        inbox_watchers.unsubscribe(email_id, queue)
+
+
+@api_router.get("/emails/{email_id}/messages/{message_id}")
+async def get_message_detail(email_id: int, message_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Get message detail"""
+    email = await resolve_mailbox(db, email_id)
+    
+    message = await fetch_message_detail(email, message_id)
+    
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
     
@@ -1074,86 +1729,145 @@ async def get_message_detail(email_id: int, message_id: str, db: Session = Depen
 
 
 @api_router.post("/emails/{email_id}/refresh")
-async def refresh_messages(email_id: int, db: Session = Depends(get_db)):
+async def refresh_messages(email_id: int, db: AsyncSession = Depends(get_async_db)):
     """Refresh messages for an email"""
-    email = db.query(TempEmail).filter(TempEmail.id == email_id).first()
-    if not email:
-        raise HTTPException(status_code=404, detail="Email not found")
+    email = await resolve_mailbox(db, email_id)
     
-    provider = email.provider
-    
-    if provider == "mailtm":
-        try:
-            messages = await get_mailtm_messages(email.token)
-        except HTTPException as e:
-            if e.status_code == 401:
-                try:
-                    new_token = await get_mailtm_token(email.address, email.password)
-                    email.token = new_token
-                    db.commit()
-                    messages = await get_mailtm_messages(new_token)
-                except Exception:
-                    messages = []
-            else:
-                raise
-    elif provider == "mailgw":
-        try:
-            messages = await get_mailgw_messages(email.token)
-        except HTTPException as e:
-            if e.status_code == 401:
-                try:
-                    new_token = await get_mailgw_token(email.address, email.password)
-                    email.token = new_token
-                    db.commit()
-                    messages = await get_mailgw_messages(new_token)
-                except Exception:
-                    messages = []
-            else:
-                raise
-    elif provider == "1secmail":
-        username = email.username or email.address.split("@")[0]
-        domain = email.domain or email.address.split("@")[1]
-        messages = await get_1secmail_messages(username, domain)
-    elif provider == "guerrilla":
-        messages = await get_guerrilla_messages(email.token)
-    else:
-        messages = []
+    messages = await polling_scheduler.read(email, REFRESH_MAX_AGE)
     
+    write_behind.set(email.id, current=email, message_count=len(messages))
     email.message_count = len(messages)
-    db.commit()
     
     return {"messages": messages, "count": len(messages)}
 
 
+BATCH_REFRESH_MAX = int(os.getenv("BATCH_REFRESH_MAX", "200"))
+BATCH_REFRESH_PROVIDER_CONCURRENCY = int(os.getenv("BATCH_REFRESH_PROVIDER_CONCURRENCY", "5"))
+
+
+@api_router.post("/emails/refresh")
+async def refresh_many_messages(request: RefreshEmailsRequest, db: AsyncSession = Depends(get_async_db)):
+    """Refresh several mailboxes at once; returns a map of id -> messages"""
+    ids = list(dict.fromkeys(request.ids))
+    if not ids:
+        raise HTTPException(status_code=400, detail="ids must not be empty")
+    if len(ids) > BATCH_REFRESH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_REFRESH_MAX} ids per request")
+    
+    records = {}
+    for email_id in ids:
+        record = mailbox_registry.get(email_id)
+        if record is not None:
+            records[email_id] = record
+    missing = [email_id for email_id in ids if email_id not in records]
+    if missing:
+        for row in (await db.scalars(select(TempEmail).where(TempEmail.id.in_(missing)))).all():
+            records[row.id] = mailbox_registry.put(row)
+    emails = [records[email_id] for email_id in ids if email_id in records]
+    found = {email.id for email in emails}
+    
+    # Bounded parallelism per provider, so one batch cannot flood a single upstream
+    limits = {}
+    for email in emails:
+        limits.setdefault(email.provider, asyncio.Semaphore(BATCH_REFRESH_PROVIDER_CONCURRENCY))
+    
+    async def refresh_one(email):
+        async with limits[email.provider]:
+            return await polling_scheduler.read(email, REFRESH_MAX_AGE)
+    
+    results = await asyncio.gather(*(refresh_one(email) for email in emails), return_exceptions=True)
+    
+    messages_by_id = {}
+    errors = {}
+    for email, result in zip(emails, results):
+        if isinstance(result, HTTPException):
+            errors[email.id] = str(result.detail)
+        elif isinstance(result, BaseException):
+            errors[email.id] = str(result)
+        else:
+            messages_by_id[email.id] = {"messages": result, "count": len(result)}
+    
+    # Counts go through the write-behind buffer and land in the next bulk UPDATE
+    for email in emails:
+        if email.id in messages_by_id:
+            write_behind.set(email.id, current=email, message_count=messages_by_id[email.id]["count"])
+            email.message_count = messages_by_id[email.id]["count"]
+    
+    return {
+        "results": messages_by_id,
+        "errors": errors,
+        "not_found": [email_id for email_id in ids if email_id not in found]
+    }
+
+
+@api_router.get("/emails/{email_id}/stream")
+async def stream_messages(email_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Server-Sent Events stream: a snapshot of the inbox, then one event per new message"""
+    email = await resolve_mailbox(db, email_id)
+    # Long-lived stream: don't keep a pooled connection checked out
+    await db.close()
+    
+    polling_scheduler.track(email)
+    queue = inbox_watchers.subscribe(email_id)
+    polling_scheduler.watch(email_id)
+    
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+        finally:
+            polling_scheduler.unwatch(email_id)
+            inbox_watchers.unsubscribe(email_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @api_router.delete("/emails/{email_id}")
-async def delete_email(email_id: int, db: Session = Depends(get_db)):
+async def delete_email(email_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a temporary email"""
-    email = db.query(TempEmail).filter(TempEmail.id == email_id).first()
+    email = await db.scalar(select(TempEmail).where(TempEmail.id == email_id))
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     
     deletion_time = datetime.utcnow()
+    # The latest count may still be waiting in the write-behind buffer
+    pending = write_behind.forget(email_id)
     history_email = EmailHistory(
         address=email.address,
         password=email.password,
-        token=email.token,
+        token=pending.get("token", email.token),
         account_id=email.account_id,
         created_at=email.created_at,
         expired_at=deletion_time,
-        message_count=email.message_count
+        message_count=pending.get("message_count", email.message_count)
     )
     
     db.add(history_email)
-    db.delete(email)
-    db.commit()
+    if email.provider == "local":
+        # Stored bodies of a deleted local mailbox are never read again
+        await db.execute(delete(LocalMessage).where(LocalMessage.mailbox_address == email.address.lower()))
+    await db.delete(email)
+    await db.commit()
+    token_manager.forget(email_id)
+    mailbox_registry.invalidate(email_id)
+    polling_scheduler.untrack(email_id)
     
     return {"status": "deleted"}
 
 
 @api_router.post("/emails/{email_id}/extend-time")
-async def extend_email_time(email_id: int, db: Session = Depends(get_db)):
+async def extend_email_time(email_id: int, db: AsyncSession = Depends(get_async_db)):
     """Extend email expiry time by resetting to 10 minutes from now"""
-    email = db.query(TempEmail).filter(TempEmail.id == email_id).first()
+    email = await db.scalar(select(TempEmail).where(TempEmail.id == email_id))
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     
@@ -1162,7 +1876,8 @@ async def extend_email_time(email_id: int, db: Session = Depends(get_db)):
     new_expires_at = now + timedelta(minutes=EMAIL_TTL_MINUTES)
     
     email.expires_at = new_expires_at
-    db.commit()
+    await db.commit()
+    mailbox_registry.invalidate(email_id)
     
     logging.info(f"⏰ Extended time for {email.address}: {new_expires_at.replace(tzinfo=timezone.utc).isoformat()}")
     
@@ -1172,17 +1887,25 @@ async def extend_email_time(email_id: int, db: Session = Depends(get_db)):
     }
 
 
-@api_router.get("/emails/history/list", response_model=List[EmailHistorySchema])
-async def get_email_history(db: Session = Depends(get_db)):
-    """Get all emails in history"""
-    history = db.query(EmailHistory).order_by(EmailHistory.expired_at.desc()).all()
-    return [EmailHistorySchema(**email.to_dict()) for email in history]
+@api_router.get("/emails/history/list")
+async def get_email_history(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get emails in history, most recently expired first (paginated with limit/cursor)"""
+    return await paginated_list(
+        response, db, select(EmailHistory), EmailHistory.expired_at, EmailHistory.id, limit, cursor, fields,
+        EmailHistorySchema.model_fields, lambda email: EmailHistorySchema(**email.to_dict()).model_dump()
+    )
 
 
 @api_router.get("/emails/history/{email_id}/messages")
-async def get_history_email_messages(email_id: int, db: Session = Depends(get_db)):
+async def get_history_email_messages(email_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get messages for a history email"""
-    email = db.query(EmailHistory).filter(EmailHistory.id == email_id).first()
+    email = await db.scalar(select(EmailHistory).where(EmailHistory.id == email_id))
     if not email:
         raise HTTPException(status_code=404, detail="Email not found in history")
     
@@ -1192,9 +1915,9 @@ async def get_history_email_messages(email_id: int, db: Session = Depends(get_db
 
 
 @api_router.get("/emails/history/{email_id}/messages/{message_id}")
-async def get_history_message_detail(email_id: int, message_id: str, db: Session = Depends(get_db)):
+async def get_history_message_detail(email_id: int, message_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get message detail for a history email"""
-    email = db.query(EmailHistory).filter(EmailHistory.id == email_id).first()
+    email = await db.scalar(select(EmailHistory).where(EmailHistory.id == email_id))
     if not email:
         raise HTTPException(status_code=404, detail="Email not found in history")
     
@@ -1203,15 +1926,16 @@ async def get_history_message_detail(email_id: int, message_id: str, db: Session
 
 
 @api_router.delete("/emails/history/delete")
-async def delete_history_emails(request: DeleteHistoryRequest, db: Session = Depends(get_db)):
+async def delete_history_emails(request: DeleteHistoryRequest, db: AsyncSession = Depends(get_async_db)):
     """Delete history emails"""
     try:
         if request.ids and len(request.ids) > 0:
-            deleted = db.query(EmailHistory).filter(EmailHistory.id.in_(request.ids)).delete(synchronize_session=False)
+            result = await db.execute(delete(EmailHistory).where(EmailHistory.id.in_(request.ids)))
         else:
-            deleted = db.query(EmailHistory).delete(synchronize_session=False)
+            result = await db.execute(delete(EmailHistory))
+        deleted = result.rowcount
         
-        db.commit()
+        await db.commit()
         
         return {
             "status": "deleted",
@@ -1219,7 +1943,7 @@ async def delete_history_emails(request: DeleteHistoryRequest, db: Session = Dep
         }
     except Exception as e:
         logging.error(f"Error deleting history emails: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 
@@ -1228,32 +1952,22 @@ async def delete_history_emails(request: DeleteHistoryRequest, db: Session = Dep
 # ============================================
 
 @api_router.post("/emails/{email_id}/messages/{message_id}/save")
-async def save_message(email_id: int, message_id: str, db: Session = Depends(get_db)):
+async def save_message(email_id: int, message_id: str, db: AsyncSession = Depends(get_async_db)):
     """Save a message to saved emails collection"""
     try:
-        email = db.query(TempEmail).filter(TempEmail.id == email_id).first()
-        if not email:
-            raise HTTPException(status_code=404, detail="Email not found")
+        email = await resolve_mailbox(db, email_id)
         
-        # Get message detail
-        message = None
-        provider = email.provider
-        
-        if provider == "mailtm":
-            message = await get_mailtm_message_detail(email.token, message_id)
-        elif provider == "mailgw":
-            message = await get_mailgw_message_detail(email.token, message_id)
-        elif provider == "guerrilla":
-            message = await get_guerrilla_message_detail(email.token, message_id)
+        # Get message detail (usually already cached from opening it)
+        message = await fetch_message_detail(email, message_id)
         
         if not message:
             raise HTTPException(status_code=404, detail="Message not found")
         
         # Check if already saved
-        existing = db.query(SavedEmail).filter(
+        existing = await db.scalar(select(SavedEmail).where(
             SavedEmail.email_address == email.address,
             SavedEmail.message_id == message_id
-        ).first()
+        ))
         
         if existing:
             return {
@@ -1293,13 +2007,13 @@ async def save_message(email_id: int, message_id: str, db: Session = Depends(get
             from_name=message.get("from", {}).get("name", "") if isinstance(message.get("from"), dict) else "",
             html=html_content,
             text=text_content,
+            snippet=build_snippet(text_content, html_content),
             created_at=created_at,
             saved_at=datetime.now(timezone.utc)
         )
         
         db.add(saved_email)
-        db.commit()
-        db.refresh(saved_email)
+        await db.commit()
         
         logging.info(f"💾 Saved message {message_id} from {email.address}")
         
@@ -1313,15 +2027,15 @@ async def save_message(email_id: int, message_id: str, db: Session = Depends(get
         raise
     except Exception as e:
         logging.error(f"Error saving message: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @api_router.post("/emails/{email_id}/save")
-async def save_email(email_id: int, db: Session = Depends(get_db)):
+async def save_email(email_id: int, db: AsyncSession = Depends(get_async_db)):
     """Save an email"""
     try:
-        email = db.query(TempEmail).filter(TempEmail.id == email_id).first()
+        email = await db.scalar(select(TempEmail).where(TempEmail.id == email_id))
         if not email:
             raise HTTPException(status_code=404, detail="Email not found")
         
@@ -1341,22 +2055,39 @@ async def save_email(email_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+SAVED_EMAIL_FIELDS = ["id", "email_address", "message_id", "subject", "from", "snippet", "createdAt", "saved_at"]
+
+
 @api_router.get("/emails/saved/list")
-async def get_saved_emails(db: Session = Depends(get_db)):
-    """Get all saved emails"""
+async def get_saved_emails(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=LIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get saved email summaries, most recently saved first (full bodies via /emails/saved/{saved_id})"""
     try:
-        saved_emails = db.query(SavedEmail).order_by(SavedEmail.saved_at.desc()).all()
-        return [email.to_dict() for email in saved_emails]
+        return await paginated_list(
+            response, db, select(SavedEmail), SavedEmail.saved_at, SavedEmail.id, limit, cursor, fields,
+            SAVED_EMAIL_FIELDS, lambda email: email.to_summary()
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error getting saved emails: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @api_router.get("/emails/saved/{saved_id}")
-async def get_saved_email_detail(saved_id: int, db: Session = Depends(get_db)):
+async def get_saved_email_detail(saved_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a specific saved email with full content"""
     try:
-        saved_email = db.query(SavedEmail).filter(SavedEmail.id == saved_id).first()
+        saved_email = await db.scalar(
+            select(SavedEmail)
+            .options(undefer(SavedEmail.html), undefer(SavedEmail.text))
+            .where(SavedEmail.id == saved_id)
+        )
         
         if not saved_email:
             raise HTTPException(status_code=404, detail="Saved email not found")
@@ -1375,15 +2106,16 @@ class DeleteSavedRequest(BaseModel):
 
 
 @api_router.delete("/emails/saved/delete")
-async def delete_saved_emails(request: DeleteSavedRequest, db: Session = Depends(get_db)):
+async def delete_saved_emails(request: DeleteSavedRequest, db: AsyncSession = Depends(get_async_db)):
     """Delete saved emails"""
     try:
         if request.ids and len(request.ids) > 0:
-            deleted = db.query(SavedEmail).filter(SavedEmail.id.in_(request.ids)).delete(synchronize_session=False)
+            result = await db.execute(delete(SavedEmail).where(SavedEmail.id.in_(request.ids)))
         else:
-            deleted = db.query(SavedEmail).delete(synchronize_session=False)
+            result = await db.execute(delete(SavedEmail))
+        deleted = result.rowcount
         
-        db.commit()
+        await db.commit()
         
         return {
             "status": "deleted",
@@ -1391,7 +2123,7 @@ async def delete_saved_emails(request: DeleteSavedRequest, db: Session = Depends
         }
     except Exception as e:
         logging.error(f"Error deleting saved emails: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
 
@@ -1408,6 +2140,8 @@ async def get_domains(service: str = "auto"):
         domains = await get_1secmail_domains()
     elif service == "guerrilla":
         domains = await get_guerrilla_domains()
+    elif service == "local":
+        domains = await get_local_domains()
     elif service == "auto":
         mailtm_domains = await get_mailtm_domains()
         if mailtm_domains:
@@ -1431,39 +2165,154 @@ async def get_domains(service: str = "auto"):
 @app.on_event("startup")
 async def startup_event():
     """Start background tasks on application startup"""
+    await provider_clients.start()
+    shared_provider_state.start()
+    domain_cache.start()
+    token_manager.start()
+    write_behind.start()
+    mailbox_pool.start()
+    polling_scheduler.start()
+    if LOCAL_SMTP_DOMAINS:
+        try:
+            await local_smtp.start()
+        except OSError as e:
+            # No SO_REUSEPORT (e.g. Windows): the first worker owns the listener
+            logging.warning(f"⚠️ Local SMTP port {local_smtp.port} unavailable ({e}), another worker owns the listener")
     asyncio.create_task(background_task_loop())
     logging.info("✅ Application started with background tasks (MySQL)")
     logging.info("✅ Active providers: Mail.tm, 1secmail, Mail.gw (Guerrilla Mail removed)")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared resources on application shutdown"""
+    await local_smtp.stop()
+    await polling_scheduler.stop()
+    await mailbox_pool.stop()
+    await domain_cache.stop()
+    await token_manager.stop()
+    await write_behind.stop()
+    await provider_clients.close()
+    await shared_provider_state.stop()
+    await async_engine.dispose()
+
+
+EXPIRY_CHECK_INTERVAL = float(os.getenv("EXPIRY_CHECK_INTERVAL", "30"))
+EXPIRY_BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", "1000"))
+_expiry_stats = {
+    "sweeps": 0,
+    "extended_total": 0,
+    "last_extended": 0,
+    "last_batches": 0,
+    "last_duration_ms": 0.0,
+    "max_duration_ms": 0.0
+}
+
+
+async def sweep_expired_emails():
+    """Auto-extend expired emails with bounded set-based UPDATEs (uses the expires_at index)"""
+    started = time.perf_counter()
+    # Use naive UTC to match stored DATETIME
+    now = datetime.utcnow()
+    new_expires_at = now + timedelta(minutes=EMAIL_TTL_MINUTES)
+    extended = 0
+    batches = 0
+    
+    async with AsyncSessionLocal() as db:
+        while True:
+            # Extended rows leave the expires_at <= now range, so each batch picks up new ones
+            result = await db.execute(
+                update(TempEmail)
+                .where(TempEmail.expires_at <= now)
+                .values(expires_at=new_expires_at)
+                .with_dialect_options(mysql_limit=EXPIRY_BATCH_SIZE)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            batches += 1
+            extended += result.rowcount
+            if result.rowcount < EXPIRY_BATCH_SIZE:
+                break
+    
+    duration_ms = (time.perf_counter() - started) * 1000
+    _expiry_stats["sweeps"] += 1
+    _expiry_stats["extended_total"] += extended
+    _expiry_stats["last_extended"] = extended
+    _expiry_stats["last_batches"] = batches
+    _expiry_stats["last_duration_ms"] = round(duration_ms, 1)
+    _expiry_stats["max_duration_ms"] = round(max(_expiry_stats["max_duration_ms"], duration_ms), 1)
+    if extended:
+        logging.info(f"Auto-extended {extended} emails to keep them active ({batches} batches, {duration_ms:.0f}ms)")
+
+
+LOCAL_MESSAGE_RETENTION_HOURS = float(os.getenv("LOCAL_MESSAGE_RETENTION_HOURS", "24"))
+
+
+async def purge_orphan_local_messages():
+    """Delete old local messages whose mailbox no longer exists (or never did), in bounded batches"""
+    cutoff = datetime.utcnow() - timedelta(hours=LOCAL_MESSAGE_RETENTION_HOURS)
+    purged = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            result = await db.execute(
+                delete(LocalMessage)
+                .where(
+                    LocalMessage.received_at < cutoff,
+                    LocalMessage.mailbox_address.not_in(
+                        select(TempEmail.address).where(TempEmail.provider == "local")
+                    )
+                )
+                .with_dialect_options(mysql_limit=EXPIRY_BATCH_SIZE)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            purged += result.rowcount
+            if result.rowcount < EXPIRY_BATCH_SIZE:
+                break
+    if purged:
+        logging.info(f"🧹 Purged {purged} local messages of deleted mailboxes")
+
+
 async def background_task_loop():
     """Main background task loop"""
-    CHECK_INTERVAL = 30
-    logging.info(f"🚀 Background task started - checking every {CHECK_INTERVAL}s")
+    logging.info(f"🚀 Background task started - checking every {EXPIRY_CHECK_INTERVAL}s")
     
     while True:
         try:
-            db = SessionLocal()
-            # Use naive UTC to match stored DATETIME
-            now = datetime.utcnow()
-
-            # Auto-extend emails instead of deleting once TTL is reached
-            expired_emails = db.query(TempEmail).filter(TempEmail.expires_at <= now).all()
-
-            if expired_emails:
-                for email in expired_emails:
-                    email.expires_at = now + timedelta(minutes=EMAIL_TTL_MINUTES)
-
-                db.commit()
-                logging.info(f"Auto-extended {len(expired_emails)} emails to keep them active")
-
-            db.close()
+            await sweep_expired_emails()
+            if LOCAL_SMTP_DOMAINS:
+                await purge_orphan_local_messages()
         except Exception as e:
             logging.error(f"❌ Error in background task loop: {e}")
         
-        await asyncio.sleep(CHECK_INTERVAL)
+        await asyncio.sleep(EXPIRY_CHECK_INTERVAL)
 
 
+# Admission control for mailbox creation (added before CORS so rejections still carry CORS headers)
+# ADMISSION_STORE_BACKEND takes the same values as SHARED_STATE_BACKEND (and defaults to it)
+_admission_backend = create_state_backend(
+    os.getenv("ADMISSION_STORE_BACKEND", os.getenv("SHARED_STATE_BACKEND", "memory")),
+    AsyncSessionLocal,
+    SharedState.__table__
+)
+admission = AdmissionController(
+    InMemoryWindowStore() if isinstance(_admission_backend, MemoryStateBackend) else SharedWindowStore(_admission_backend),
+    limit=int(os.getenv("ADMISSION_RATE_LIMIT", "10")),
+    window=float(os.getenv("ADMISSION_WINDOW_SECONDS", "60")),
+    # Mailboxes per client per window through /emails/create/batch (defaults to BATCH_CREATE_MAX)
+    batch_limit=int(os.getenv("ADMISSION_BATCH_RATE_LIMIT", str(BATCH_CREATE_MAX))),
+    max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "20")),
+    max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "50")),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+    trust_proxy=os.getenv("ADMISSION_TRUST_PROXY", "false").lower() == "true"
+)
+app.add_middleware(
+    AdmissionMiddleware,
+    controller=admission,
+    paths=["/api/emails/create"],
+    handler_charged_paths=["/api/emails/create/batch"]
+)
+
 # CORS configuration
 cors_origins = os.environ.get('CORS_ORIGINS', '*')
 if cors_origins == '*':
@@ -1479,6 +2328,7 @@ app.add_middleware(
     allow_credentials=allow_credentials,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
 
 # Include the router in the main app
@@ -0,0 +1,288 @@
+"""Provider state shared across worker processes.
+
+With several uvicorn/gunicorn workers every process would otherwise keep its
+own circuit breakers, success counters and domain cache, so one worker keeps
+calling a provider another worker has just seen 429 from. A small key/value
+backend lets the fleet act as one client:
+
+- circuit openings are published and adopted by every worker;
+- success/failure counters are summed fleet-wide;
+- provider domain lists are loaded upstream by one worker and reused by all.
+
+Backends: ``memory`` (per process, the fallback), ``mysql`` (the app's own
+database) and ``redis://...`` (needs the optional ``redis`` package).
+"""
+import asyncio
+import json
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.mysql import insert
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackend:
+    """Minimal async key/value interface: JSON values with TTL plus integer counters"""
+
+    async def get(self, key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: dict, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Add to a counter; ``ttl`` (applied when the counter is created) lets it expire"""
+        raise NotImplementedError
+
+    async def purge_expired(self) -> int:
+        """Drop expired entries where the store does not do so itself"""
+        return 0
+
+
+class MemoryStateBackend(StateBackend):
+    """Per-process backend (single worker, or fallback when no shared store is configured)"""
+
+    def __init__(self):
+        self._values: Dict[str, tuple] = {}
+        self._counters: Dict[str, list] = {}
+
+    async def get(self, key: str) -> Optional[dict]:
+        item = self._values.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and time.time() >= expires_at:
+            del self._values[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: dict, ttl: Optional[float] = None):
+        self._values[key] = (value, time.time() + ttl if ttl else None)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        item = self._counters.get(key)
+        if item is None or (item[1] is not None and now >= item[1]):
+            item = self._counters[key] = [0, now + ttl if ttl else None]
+        item[0] += amount
+        return item[0]
+
+
+class SQLStateBackend(StateBackend):
+    """Backend on a MySQL table (see models.SharedState), using upserts for writes"""
+
+    def __init__(self, session_factory, table):
+        self.session_factory = session_factory
+        self.table = table
+
+    async def get(self, key: str) -> Optional[dict]:
+        async with self.session_factory() as db:
+            row = (await db.execute(
+                select(self.table.c.value, self.table.c.expires_at).where(self.table.c.key == key)
+            )).first()
+        if row is None or row.value is None:
+            return None
+        if row.expires_at is not None and row.expires_at <= datetime.utcnow():
+            return None
+        return json.loads(row.value)
+
+    async def set(self, key: str, value: dict, ttl: Optional[float] = None):
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl) if ttl else None
+        stmt = insert(self.table).values(key=key, value=json.dumps(value), counter=0, expires_at=expires_at)
+        stmt = stmt.on_duplicate_key_update(value=stmt.inserted.value, expires_at=stmt.inserted.expires_at)
+        async with self.session_factory() as db:
+            await db.execute(stmt)
+            await db.commit()
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl) if ttl else None
+        stmt = insert(self.table).values(key=key, counter=amount, expires_at=expires_at)
+        stmt = stmt.on_duplicate_key_update(counter=self.table.c.counter + amount)
+        async with self.session_factory() as db:
+            await db.execute(stmt)
+            await db.commit()
+            return await db.scalar(select(self.table.c.counter).where(self.table.c.key == key))
+
+    async def purge_expired(self) -> int:
+        async with self.session_factory() as db:
+            result = await db.execute(delete(self.table).where(self.table.c.expires_at <= datetime.utcnow()))
+            await db.commit()
+            return result.rowcount
+
+
+class RedisStateBackend(StateBackend):
+    """Backend on Redis (or any Redis-protocol store)"""
+
+    def __init__(self, url: str, prefix: str = "tempmail:"):
+        import redis.asyncio as redis  # optional dependency
+
+        self.prefix = prefix
+        self._redis = redis.from_url(url, decode_responses=True)
+
+    async def get(self, key: str) -> Optional[dict]:
+        raw = await self._redis.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    async def set(self, key: str, value: dict, ttl: Optional[float] = None):
+        await self._redis.set(self.prefix + key, json.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        if not ttl:
+            return await self._redis.incrby(self.prefix + "counter:" + key, amount)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.incrby(self.prefix + "counter:" + key, amount)
+            pipe.expire(self.prefix + "counter:" + key, max(1, math.ceil(ttl)))
+            value, _ = await pipe.execute()
+        return value
+
+
+def create_state_backend(spec: str, session_factory=None, table=None) -> StateBackend:
+    """Build a backend from SHARED_STATE_BACKEND ("memory", "mysql" or a redis:// URL)"""
+    spec = (spec or "memory").strip()
+    try:
+        if spec.startswith(("redis://", "rediss://", "unix://")):
+            return RedisStateBackend(spec)
+        if spec == "mysql" and session_factory is not None and table is not None:
+            return SQLStateBackend(session_factory, table)
+    except ImportError as e:
+        logger.warning(f"⚠️ Shared state backend '{spec}' unavailable ({e}), using in-memory state")
+        return MemoryStateBackend()
+    if spec != "memory":
+        logger.warning(f"⚠️ Unknown shared state backend '{spec}', using in-memory state")
+    return MemoryStateBackend()
+
+
+DomainLoader = Callable[[], Awaitable[List[str]]]
+
+
+class SharedProviderState:
+    """Synchronises circuit breakers, provider counters and domain lists through a StateBackend"""
+
+    def __init__(
+        self,
+        backend: StateBackend,
+        breakers,
+        providers: List[str],
+        counters: Dict[str, dict],
+        domain_ttl: float = 240,
+        sync_interval: float = 2,
+        totals_interval: float = 30,
+    ):
+        self.backend = backend
+        self.breakers = breakers
+        self.providers = providers
+        self.counters = counters
+        self.domain_ttl = domain_ttl
+        self.sync_interval = sync_interval
+        self.totals_interval = totals_interval
+        self._totals_read_at = 0.0
+        self._published_open: Dict[str, float] = {}
+        self._synced_counts: Dict[tuple, int] = {}
+        self._fleet_counts: Dict[str, dict] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"syncs": 0, "sync_errors": 0, "adopted_opens": 0, "published_opens": 0, "shared_domain_hits": 0}
+
+    def poke(self):
+        """Sync soon (e.g. right after a local breaker tripped)"""
+        self._wake.set()
+
+    def shared_loader(self, provider: str, loader: DomainLoader) -> DomainLoader:
+        """Wrap a domain loader so one worker's upstream load serves the whole fleet"""
+        async def load() -> List[str]:
+            try:
+                cached = await self.backend.get(f"domains:{provider}")
+            except Exception as e:
+                cached = None
+                logger.warning(f"⚠️ Shared domain lookup for {provider} failed: {e}")
+            if cached and cached.get("domains"):
+                self._stats["shared_domain_hits"] += 1
+                return cached["domains"]
+            domains = await loader()
+            if domains:
+                try:
+                    await self.backend.set(f"domains:{provider}", {"domains": list(domains)}, ttl=self.domain_ttl)
+                except Exception as e:
+                    logger.warning(f"⚠️ Could not share {provider} domains: {e}")
+            return domains
+        return load
+
+    async def _sync_circuit(self, provider: str):
+        breaker = self.breakers.get(provider)
+        now = time.time()
+        breaker.snapshot()  # moves an elapsed OPEN state on to HALF_OPEN
+        if breaker.state == "open" and breaker.open_until > self._published_open.get(provider, 0):
+            await self.backend.set(
+                f"circuit:{provider}", {"open_until": breaker.open_until}, ttl=breaker.open_until - now
+            )
+            self._published_open[provider] = breaker.open_until
+            self._stats["published_opens"] += 1
+
+        shared = await self.backend.get(f"circuit:{provider}")
+        open_until = (shared or {}).get("open_until", 0)
+        if open_until > now and (breaker.state != "open" or open_until > breaker.open_until + 1):
+            breaker.force_open(open_until)
+            self._published_open[provider] = open_until
+            self._stats["adopted_opens"] += 1
+
+    async def _sync_counters(self, provider: str, read_totals: bool):
+        """Push local counter deltas; unchanged counters only re-read the fleet total when asked"""
+        local = self.counters.get(provider)
+        if local is None:
+            return
+        fleet = self._fleet_counts.setdefault(provider, {})
+        for field in ("success", "failures"):
+            delta = local.get(field, 0) - self._synced_counts.get((provider, field), 0)
+            if delta or read_totals or field not in fleet:
+                fleet[field] = await self.backend.incr(f"stats:{provider}:{field}", delta)
+                self._synced_counts[(provider, field)] = local.get(field, 0)
+
+    async def sync(self):
+        now = time.time()
+        read_totals = now - self._totals_read_at >= self.totals_interval
+        for provider in self.providers:
+            await self._sync_circuit(provider)
+            await self._sync_counters(provider, read_totals)
+        if read_totals:
+            self._totals_read_at = now
+        self._stats["syncs"] += 1
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.sync_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.sync()
+            except Exception as e:
+                # Keep working on local state until the backend is reachable again
+                self._stats["sync_errors"] += 1
+                logger.warning(f"⚠️ Shared provider state sync failed: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"🔗 Shared provider state via {type(self.backend).__name__}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.warning(f"⚠️ Final shared state sync failed: {e}")
+
+    def fleet_stats(self) -> Dict[str, dict]:
+        return dict(self._fleet_counts)
+
+    def stats(self) -> dict:
+        return {**self._stats, "backend": type(self.backend).__name__}
@@ -0,0 +1,51 @@
+"""In-process single-flight request coalescing.
+
+Concurrent callers asking for the same key await one shared in-flight call
+instead of each issuing their own upstream request.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into a single execution"""
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._stats = {"calls": 0, "executions": 0, "shared": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run ``fn`` for ``key`` unless a call for that key is already running.
+
+        The shared task is shielded so a caller that disconnects does not cancel
+        the request other callers are waiting on. Results are shared by
+        reference, so callers must treat them as read-only.
+        """
+        self._stats["calls"] += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self._stats["shared"] += 1
+            return await asyncio.shield(task)
+
+        self._stats["executions"] += 1
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved in case every caller went away
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"{self.name} call for {key} failed: {task.exception()}")
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> dict:
+        return {**self._stats, "in_flight": len(self._inflight)}
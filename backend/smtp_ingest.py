@@ -0,0 +1,232 @@
+"""Built-in SMTP listener for self-hosted domains (provider "local").
+
+A small asyncio SMTP server accepts mail for the configured domains, parses
+it with the standard library ``email`` package and stores it in MySQL, so
+local mailboxes are read without any upstream round trip. It speaks the
+subset of RFC 5321 a normal MTA or ``smtplib`` client needs
+(EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT).
+"""
+import asyncio
+import email
+import logging
+import socket
+import uuid
+from datetime import datetime
+from email import policy
+from email.utils import parseaddr
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[List[str], dict], Awaitable[None]]
+
+
+def parse_message(raw: bytes) -> dict:
+    """Parse a raw RFC 5322 message into sender, subject and html/text bodies"""
+    message = email.message_from_bytes(raw, policy=policy.default)
+    from_name, from_address = parseaddr(str(message.get("From", "")))
+
+    html_part = message.get_body(preferencelist=("html",))
+    text_part = message.get_body(preferencelist=("plain",))
+
+    def content(part) -> Optional[str]:
+        if part is None:
+            return None
+        try:
+            return part.get_content()
+        except Exception:
+            payload = part.get_payload(decode=True) or b""
+            return payload.decode("utf-8", errors="replace")
+
+    return {
+        "from_address": from_address or "unknown",
+        "from_name": from_name or from_address or "unknown",
+        "subject": str(message.get("Subject", "No Subject"))[:500],
+        "html": content(html_part),
+        "text": content(text_part),
+    }
+
+
+def store_local_message(session_factory, model, recipients: List[str], parsed: dict) -> List[str]:
+    """Insert one row per recipient mailbox; returns the generated message ids"""
+    db = session_factory()
+    try:
+        now = datetime.utcnow()
+        rows = [
+            model(
+                message_id=uuid.uuid4().hex,
+                mailbox_address=recipient,
+                from_address=parsed["from_address"],
+                from_name=parsed["from_name"],
+                subject=parsed["subject"],
+                html=parsed["html"],
+                text=parsed["text"],
+                received_at=now,
+            )
+            for recipient in recipients
+        ]
+        db.add_all(rows)
+        db.commit()
+        return [row.message_id for row in rows]
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class LocalSMTPServer:
+    """Minimal asyncio SMTP server delivering to ``handler(recipients, parsed)``"""
+
+    def __init__(
+        self,
+        domains: List[str],
+        handler: MessageHandler,
+        host: str = "127.0.0.1",
+        port: int = 2525,
+        hostname: str = "tempmail.local",
+        max_message_size: int = 10 * 1024 * 1024,
+        max_recipients: int = 100,
+        command_timeout: float = 300,
+    ):
+        self.domains = {d.lower() for d in domains}
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.hostname = hostname
+        self.max_message_size = max_message_size
+        self.max_recipients = max_recipients
+        self.command_timeout = command_timeout
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._stats = {"sessions": 0, "accepted": 0, "rejected_recipients": 0, "errors": 0}
+
+    def accepts(self, address: str) -> bool:
+        return "@" in address and address.rsplit("@", 1)[1].lower() in self.domains
+
+    async def start(self):
+        """Start listening; with SO_REUSEPORT every worker binds the port and the kernel spreads sessions"""
+        self._server = await asyncio.start_server(
+            self._session, self.host, self.port, limit=64 * 1024,
+            reuse_port=True if hasattr(socket, "SO_REUSEPORT") else None
+        )
+        logger.info(f"📮 Local SMTP listening on {self.host}:{self.port} for {', '.join(sorted(self.domains))}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _readline(self, reader: asyncio.StreamReader) -> bytes:
+        return await asyncio.wait_for(reader.readline(), timeout=self.command_timeout)
+
+    async def _read_data(self, reader: asyncio.StreamReader) -> Optional[bytes]:
+        """Read a DATA body up to the lone dot; None if it exceeded the size limit"""
+        lines = []
+        size = 0
+        too_big = False
+        while True:
+            line = await self._readline(reader)
+            if not line:
+                raise ConnectionResetError("connection closed during DATA")
+            if line in (b".\r\n", b".\n"):
+                break
+            if line.startswith(b".."):
+                line = line[1:]
+            size += len(line)
+            if size > self.max_message_size:
+                too_big = True
+            elif not too_big:
+                lines.append(line)
+        return None if too_big else b"".join(lines)
+
+    async def _session(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._stats["sessions"] += 1
+
+        def reply(text: str):
+            writer.write(f"{text}\r\n".encode())
+
+        mail_from = None
+        recipients: List[str] = []
+        reply(f"220 {self.hostname} ESMTP TempMail")
+        try:
+            while True:
+                await writer.drain()
+                line = await self._readline(reader)
+                if not line:
+                    break
+                command_line = line.decode("utf-8", errors="replace").rstrip("\r\n")
+                command, _, argument = command_line.partition(" ")
+                command = command.upper()
+
+                if command == "EHLO":
+                    reply(f"250-{self.hostname}")
+                    reply(f"250-SIZE {self.max_message_size}")
+                    reply("250-8BITMIME")
+                    reply("250 SMTPUTF8")
+                elif command == "HELO":
+                    reply(f"250 {self.hostname}")
+                elif command == "MAIL":
+                    if not argument.upper().startswith("FROM:"):
+                        reply("501 5.5.4 Syntax: MAIL FROM:<address>")
+                        continue
+                    mail_from = parseaddr(argument[5:].split(" ")[0])[1] or ""
+                    recipients = []
+                    reply("250 2.1.0 OK")
+                elif command == "RCPT":
+                    if mail_from is None:
+                        reply("503 5.5.1 Need MAIL before RCPT")
+                        continue
+                    if not argument.upper().startswith("TO:"):
+                        reply("501 5.5.4 Syntax: RCPT TO:<address>")
+                        continue
+                    recipient = parseaddr(argument[3:].split(" ")[0])[1].lower()
+                    if not self.accepts(recipient):
+                        self._stats["rejected_recipients"] += 1
+                        reply("550 5.1.1 Mailbox unavailable")
+                    elif len(recipients) >= self.max_recipients:
+                        reply("452 4.5.3 Too many recipients")
+                    else:
+                        recipients.append(recipient)
+                        reply("250 2.1.5 OK")
+                elif command == "DATA":
+                    if not recipients:
+                        reply("503 5.5.1 Need RCPT before DATA")
+                        continue
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    raw = await self._read_data(reader)
+                    if raw is None:
+                        reply("552 5.3.4 Message too big")
+                    else:
+                        try:
+                            await self.handler(recipients, parse_message(raw))
+                            self._stats["accepted"] += 1
+                            reply("250 2.0.0 OK: queued")
+                        except Exception as e:
+                            self._stats["errors"] += 1
+                            logger.error(f"❌ Local SMTP delivery error: {e}")
+                            reply("451 4.3.0 Local error in processing")
+                    mail_from = None
+                    recipients = []
+                elif command == "RSET":
+                    mail_from = None
+                    recipients = []
+                    reply("250 2.0.0 OK")
+                elif command == "NOOP":
+                    reply("250 2.0.0 OK")
+                elif command == "VRFY":
+                    reply("252 2.5.2 Cannot VRFY user")
+                elif command == "QUIT":
+                    reply("221 2.0.0 Bye")
+                    break
+                else:
+                    reply("502 5.5.2 Command not recognized")
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def stats(self) -> dict:
+        return {**self._stats, "listening": self._server is not None, "port": self.port}
@@ -0,0 +1,97 @@
+"""Cost-based sliding windows and Retry-After values of the admission window stores"""
+import asyncio
+import types
+
+import pytest
+
+import admission
+import shared_state
+from admission import AdmissionController, InMemoryWindowStore, SharedWindowStore
+from shared_state import MemoryStateBackend
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = types.SimpleNamespace(now=6000.0)
+    fake.time = fake.monotonic = lambda: fake.now
+    monkeypatch.setattr(admission, "time", fake)
+    monkeypatch.setattr(shared_state, "time", fake)
+    return fake
+
+
+def hits(store, *costs, limit=10, window=60):
+    async def run():
+        return [await store.hit("client", limit, window, cost) for cost in costs]
+    return asyncio.run(run())
+
+
+def test_in_memory_charges_by_cost(clock):
+    store = InMemoryWindowStore()
+    assert hits(store, 4, 4) == [(True, 0.0), (True, 0.0)]
+    allowed, retry_after = hits(store, 4)[0]
+    assert not allowed
+    assert retry_after == 60  # both earlier hits are still in the window
+    assert hits(store, 2) == [(True, 0.0)]
+
+
+def test_in_memory_retry_after_waits_for_enough_room(clock):
+    store = InMemoryWindowStore()
+    hits(store, 3)
+    clock.now += 10
+    hits(store, 3)
+    clock.now += 10
+    hits(store, 4)
+    # Freeing 6 units needs the first two hits to expire: 20s ago + 10s ago
+    assert hits(store, 6) == [(False, 50)]
+    clock.now += 50
+    assert hits(store, 6) == [(True, 0.0)]
+
+
+def test_cost_above_limit_is_never_admitted(clock):
+    assert hits(InMemoryWindowStore(), 11) == [(False, 60)]
+    assert hits(SharedWindowStore(MemoryStateBackend()), 11) == [(False, 60)]
+
+
+def test_shared_store_weights_previous_window(clock):
+    clock.now = 6000.0  # start of a 60s bucket
+    store = SharedWindowStore(MemoryStateBackend())
+    assert hits(store, 8) == [(True, 0.0)]
+    clock.now += 90  # halfway through the next bucket: 8 * 0.5 = 4 still count
+    assert hits(store, 6) == [(True, 0.0)]
+    allowed, retry_after = hits(store, 1)[0]
+    assert not allowed
+    assert retry_after == 30  # until the current bucket ends
+
+
+def test_shared_store_rolls_back_rejected_cost(clock):
+    clock.now = 6000.0
+    store = SharedWindowStore(MemoryStateBackend())
+    hits(store, 9)
+    assert not hits(store, 5)[0][0]
+    assert hits(store, 1) == [(True, 0.0)]
+
+
+def test_controller_keeps_batch_budget_separate(clock):
+    controller = AdmissionController(limit=2, window=60, batch_limit=50)
+
+    async def run():
+        return (
+            await controller.check_rate("ip:1", cost=40, batch=True),
+            await controller.check_rate("ip:1"),
+            await controller.check_rate("ip:1"),
+            await controller.check_rate("ip:1"),
+        )
+
+    batch, first, second, third = asyncio.run(run())
+    assert batch[0] and first[0] and second[0]
+    assert not third[0]
+
+
+def test_controller_fails_open_on_store_errors(clock):
+    class BrokenStore:
+        async def hit(self, *args):
+            raise ConnectionError("store down")
+
+    controller = AdmissionController(BrokenStore())
+    assert asyncio.run(controller.check_rate("ip:1")) == (True, 0.0)
+    assert controller.stats()["store_errors"] == 1
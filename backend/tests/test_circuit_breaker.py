@@ -0,0 +1,96 @@
+"""Circuit breaker state machine, driven by a fake clock"""
+import types
+
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = types.SimpleNamespace(now=1000.0)
+    fake.time = lambda: fake.now
+    monkeypatch.setattr(circuit_breaker, "time", fake)
+    return fake
+
+
+def make_breaker(**settings):
+    defaults = dict(min_calls=4, failure_rate_threshold=0.5, open_seconds=10, max_open_seconds=35,
+                    half_open_max_calls=1, half_open_successes=2)
+    return CircuitBreaker("test", **{**defaults, **settings})
+
+
+def test_opens_on_failure_rate_after_min_calls(clock):
+    breaker = make_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    assert breaker.state == CLOSED  # below min_calls
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.remaining_open() == 10
+
+
+def test_old_outcomes_leave_the_window(clock):
+    breaker = make_breaker(window_seconds=60)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 61
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_trip_opens_immediately(clock):
+    breaker = make_breaker()
+    breaker.record_failure(trip=True)
+    assert breaker.state == OPEN
+
+
+def test_half_open_admits_limited_trials_and_closes_after_successes(clock):
+    breaker = make_breaker()
+    breaker.record_failure(trip=True)
+    clock.now += 10
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # the single trial slot is taken
+    breaker.record_success()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.consecutive_opens == 0
+
+
+def test_release_returns_a_trial_slot(clock):
+    breaker = make_breaker()
+    breaker.record_failure(trip=True)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_reopen_duration_grows_exponentially_up_to_the_cap(clock):
+    breaker = make_breaker()
+    durations = []
+    breaker.record_failure(trip=True)
+    for _ in range(3):
+        durations.append(breaker.open_until - clock.now)
+        clock.now = breaker.open_until
+        assert breaker.allow()
+        breaker.record_failure()  # failed trial re-opens
+    durations.append(breaker.open_until - clock.now)
+    assert durations == [10, 20, 35, 35]
+
+
+def test_force_open_only_extends(clock):
+    breaker = make_breaker()
+    breaker.force_open(clock.now + 30)
+    assert breaker.state == OPEN
+    breaker.force_open(clock.now + 5)
+    assert breaker.open_until == clock.now + 30
+    clock.now += 30
+    assert breaker.available()
+    assert breaker.state == HALF_OPEN
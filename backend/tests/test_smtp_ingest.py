@@ -0,0 +1,94 @@
+"""Round trip through the local SMTP listener with a plain smtplib client (no database needed)"""
+import asyncio
+import smtplib
+from email.message import EmailMessage
+
+import pytest
+
+from smtp_ingest import LocalSMTPServer, parse_message
+
+
+def run_with_server(client, domains=("test.local",)):
+    """Start a listener on a free localhost port, run ``client(port)`` in a thread, return deliveries"""
+    delivered = []
+
+    async def handler(recipients, parsed):
+        delivered.append((recipients, parsed))
+
+    async def scenario():
+        server = LocalSMTPServer(list(domains), handler, host="127.0.0.1", port=0)
+        await server.start()
+        try:
+            port = server._server.sockets[0].getsockname()[1]
+            result = await asyncio.to_thread(client, port)
+        finally:
+            await server.stop()
+        return result
+
+    return asyncio.run(scenario()), delivered
+
+
+def build_message(to):
+    message = EmailMessage()
+    message["From"] = "Sender Name <sender@example.com>"
+    message["To"] = to
+    message["Subject"] = "Your code"
+    message.set_content("Code: 1234\n.leading dot line")
+    message.add_alternative("<p>Code: <b>1234</b></p>", subtype="html")
+    return message
+
+
+def test_smtplib_round_trip():
+    def client(port):
+        with smtplib.SMTP("127.0.0.1", port, timeout=5) as smtp:
+            return smtp.send_message(build_message("Box@Test.local"), to_addrs=["Box@Test.local", "x@other.org"])
+
+    refused, delivered = run_with_server(client)
+
+    assert list(refused) == ["x@other.org"]
+    assert len(delivered) == 1
+    recipients, parsed = delivered[0]
+    assert recipients == ["box@test.local"]
+    assert parsed["from_address"] == "sender@example.com"
+    assert parsed["from_name"] == "Sender Name"
+    assert parsed["subject"] == "Your code"
+    assert "<b>1234</b>" in parsed["html"]
+    assert ".leading dot line" in parsed["text"]
+
+
+def test_rejects_foreign_domains():
+    def client(port):
+        with smtplib.SMTP("127.0.0.1", port, timeout=5) as smtp:
+            smtp.send_message(build_message("x@other.org"))
+
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        run_with_server(client)
+
+
+def test_rejects_oversized_message():
+    def client(port):
+        with smtplib.SMTP("127.0.0.1", port, timeout=5) as smtp:
+            smtp.sendmail("sender@example.com", ["box@test.local"], "Subject: big\r\n\r\n" + "x" * 2048)
+
+    async def handler(recipients, parsed):
+        raise AssertionError("oversized message must not be delivered")
+
+    async def scenario():
+        server = LocalSMTPServer(["test.local"], handler, host="127.0.0.1", port=0, max_message_size=1024)
+        await server.start()
+        try:
+            port = server._server.sockets[0].getsockname()[1]
+            await asyncio.to_thread(client, port)
+        finally:
+            await server.stop()
+
+    with pytest.raises(smtplib.SMTPDataError) as error:
+        asyncio.run(scenario())
+    assert error.value.smtp_code == 552
+
+
+def test_parse_message_without_html():
+    parsed = parse_message(b"From: a@example.com\r\nSubject: Hi\r\n\r\nplain body\r\n")
+    assert parsed["html"] is None
+    assert parsed["text"].strip() == "plain body"
+    assert parsed["from_name"] == "a@example.com"
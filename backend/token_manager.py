@@ -0,0 +1,145 @@
+"""Proactive JWT management for Mail.tm / Mail.gw mailboxes.
+
+Tokens are decoded to learn their expiry and refreshed in the background
+shortly before they lapse, so inbox reads don't pay a 401-then-retry round
+trip. Concurrent refreshes of the same mailbox share one upstream call, and
+new tokens are queued on a write-behind buffer instead of written mid-request.
+"""
+import asyncio
+import base64
+import json
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+TokenFetcher = Callable[[str, str], Awaitable[str]]
+
+
+def decode_jwt_expiry(token: str) -> Optional[float]:
+    """Return the ``exp`` claim of a JWT (unverified), or None if it has none"""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp is not None else None
+    except Exception:
+        return None
+
+
+class _TrackedToken:
+    __slots__ = ("email_id", "provider", "address", "password", "token", "expires_at", "last_used")
+
+    def __init__(self, email_id, provider, address, password, token):
+        self.email_id = email_id
+        self.provider = provider
+        self.address = address
+        self.password = password
+        self.token = token
+        self.expires_at = decode_jwt_expiry(token)
+        self.last_used = time.time()
+
+
+class TokenManager:
+    """Keeps provider tokens fresh and hands new ones to a write-behind buffer"""
+
+    def __init__(
+        self,
+        writer,
+        fetchers: Dict[str, TokenFetcher],
+        refresh_ahead: float = 300,
+        check_interval: float = 30,
+        idle_ttl: float = 3600,
+    ):
+        self.writer = writer
+        self.fetchers = fetchers
+        self.refresh_ahead = refresh_ahead
+        self.check_interval = check_interval
+        self.idle_ttl = idle_ttl
+        self._tracked: Dict[int, _TrackedToken] = {}
+        self._listeners: List[Callable[[int, str], None]] = []
+        self._flights = SingleFlight("token")
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"refreshes": 0, "proactive_refreshes": 0, "refresh_failures": 0}
+
+    def add_listener(self, listener: Callable[[int, str], None]):
+        """Call ``listener(email_id, token)`` after every successful refresh"""
+        self._listeners.append(listener)
+
+    def manages(self, provider: str) -> bool:
+        return provider in self.fetchers
+
+    def _track(self, email) -> _TrackedToken:
+        tracked = self._tracked.get(email.id)
+        if tracked is None:
+            tracked = _TrackedToken(email.id, email.provider, email.address, email.password, email.token)
+            self._tracked[email.id] = tracked
+        tracked.last_used = time.time()
+        return tracked
+
+    def _needs_refresh(self, tracked: _TrackedToken, margin: float) -> bool:
+        return tracked.expires_at is not None and tracked.expires_at - time.time() <= margin
+
+    async def get_token(self, email) -> str:
+        """Return a usable token for the mailbox, refreshing first only if it has already expired"""
+        tracked = self._track(email)
+        if self._needs_refresh(tracked, 0):
+            try:
+                return await self.refresh(email)
+            except Exception as e:
+                logger.warning(f"⚠️ Token refresh failed for {email.address}: {e}")
+        return tracked.token
+
+    async def refresh(self, email) -> str:
+        """Fetch a new token (deduplicated per mailbox) and queue it for write-back"""
+        tracked = self._track(email)
+        return await self._flights.do(tracked.email_id, lambda: self._refresh(tracked))
+
+    async def _refresh(self, tracked: _TrackedToken) -> str:
+        self._stats["refreshes"] += 1
+        try:
+            token = await self.fetchers[tracked.provider](tracked.address, tracked.password)
+        except Exception:
+            self._stats["refresh_failures"] += 1
+            raise
+        tracked.token = token
+        tracked.expires_at = decode_jwt_expiry(token)
+        self.writer.set(tracked.email_id, token=token)
+        for listener in self._listeners:
+            listener(tracked.email_id, token)
+        return token
+
+    def forget(self, email_id: int):
+        """Stop tracking a mailbox (deleted)"""
+        self._tracked.pop(email_id, None)
+        self.writer.forget(email_id)
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            now = time.time()
+            for email_id, tracked in list(self._tracked.items()):
+                if now - tracked.last_used > self.idle_ttl:
+                    del self._tracked[email_id]
+                elif self._needs_refresh(tracked, self.refresh_ahead):
+                    self._stats["proactive_refreshes"] += 1
+                    try:
+                        await self._flights.do(email_id, lambda t=tracked: self._refresh(t))
+                    except Exception as e:
+                        logger.warning(f"⚠️ Proactive token refresh failed for {tracked.address}: {e}")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {**self._stats, "tracked": len(self._tracked)}
@@ -0,0 +1,104 @@
+"""Write-behind buffer for hot per-row column updates.
+
+Reads that only refresh derived columns (message counts, provider tokens)
+queue their changes here instead of committing on the request path. Values
+that did not change are dropped, repeated changes to a row collapse into the
+latest one, and everything pending is written as executemany UPDATEs on an
+interval, when the buffer grows past ``max_pending`` rows, and on shutdown.
+"""
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy import bindparam, update
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Coalesces column updates per row id and flushes them in bulk"""
+
+    def __init__(self, session_factory, table, flush_interval: float = 5, max_pending: int = 500):
+        self.session_factory = session_factory
+        self.table = table
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[int, dict] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._size_flush: Optional[asyncio.Task] = None
+        self._stats = {"queued": 0, "skipped_unchanged": 0, "flushes": 0, "rows_written": 0, "flush_errors": 0}
+
+    def set(self, row_id: int, current=None, **values):
+        """Queue column values for a row; values equal to ``current`` (the row as loaded) are skipped"""
+        pending = self._pending.get(row_id, {})
+        changes = {}
+        for column, value in values.items():
+            if column in pending:
+                unchanged = pending[column] == value
+            else:
+                unchanged = current is not None and getattr(current, column) == value
+            if unchanged:
+                self._stats["skipped_unchanged"] += 1
+            else:
+                changes[column] = value
+        if not changes:
+            return
+        self._pending[row_id] = {**pending, **changes}
+        self._stats["queued"] += 1
+        if len(self._pending) >= self.max_pending and (self._size_flush is None or self._size_flush.done()):
+            self._size_flush = asyncio.create_task(self.flush())
+
+    def forget(self, row_id: int) -> dict:
+        """Drop pending writes for a row (e.g. it was deleted); returns the values that were pending"""
+        return self._pending.pop(row_id, None) or {}
+
+    async def flush(self):
+        """Write everything pending: one executemany UPDATE per distinct column set"""
+        async with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            groups: Dict[tuple, list] = {}
+            for row_id, values in pending.items():
+                columns = tuple(sorted(values))
+                groups.setdefault(columns, []).append({"b_id": row_id, **{f"b_{c}": values[c] for c in columns}})
+
+            async with self.session_factory() as db:
+                try:
+                    for columns, params in groups.items():
+                        stmt = (
+                            update(self.table)
+                            .where(self.table.c.id == bindparam("b_id"))
+                            .values({c: bindparam(f"b_{c}") for c in columns})
+                        )
+                        await db.execute(stmt, params)
+                    await db.commit()
+                    self._stats["flushes"] += 1
+                    self._stats["rows_written"] += len(pending)
+                except Exception as e:
+                    self._stats["flush_errors"] += 1
+                    logger.error(f"❌ Write-behind flush failed ({len(pending)} rows): {e}")
+                    await db.rollback()
+                    # Retry next time, without overwriting newer values queued meanwhile
+                    for row_id, values in pending.items():
+                        self._pending[row_id] = {**values, **self._pending.get(row_id, {})}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {**self._stats, "pending_rows": len(self._pending)}
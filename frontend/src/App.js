@@ -256,21 +256,51 @@ function App() {
   }, []);
 
 
-  // Auto refresh messages every 30 seconds (silent mode)
+  // Live inbox updates over Server-Sent Events (falls back to 30s polling)
   useEffect(() => {
     if (currentEmail?.id && autoRefresh) {
-      console.log('🔄 Auto-refresh enabled for email:', currentEmail.address);
-      
-      const interval = setInterval(() => {
-        if (currentEmail?.id) {
-          console.log('🔄 Auto-refreshing messages...');
-          refreshMessages(currentEmail.id, false); // Silent refresh (no toast)
+      const emailId = currentEmail.id;
+      let interval = null;
+
+      const startPolling = () => {
+        if (interval) return;
+        console.log('🔄 Auto-refresh (polling) enabled for email:', currentEmail.address);
+        interval = setInterval(() => {
+          refreshMessages(emailId, false); // Silent refresh (no toast)
+        }, 30000); // 30 seconds
+      };
+
+      if (typeof window.EventSource === 'undefined') {
+        startPolling();
+        return () => clearInterval(interval);
+      }
+
+      console.log('📡 Live inbox stream enabled for email:', currentEmail.address);
+      const source = new EventSource(`${API}/emails/${emailId}/stream`);
+
+      source.addEventListener('snapshot', (event) => {
+        const data = JSON.parse(event.data);
+        setMessages(data.messages);
+      });
+
+      source.addEventListener('new_message', (event) => {
+        const message = JSON.parse(event.data);
+        setMessages((prev) => (
+          prev.some((m) => m.id === message.id) ? prev : [message, ...prev]
+        ));
+      });
+
+      source.onerror = () => {
+        // The browser retries on its own unless the stream was closed for good
+        if (source.readyState === EventSource.CLOSED) {
+          startPolling();
         }
-      }, 30000); // 30 seconds
-      
+      };
+
       return () => {
         console.log('🛑 Auto-refresh cleanup');
-        clearInterval(interval);
+        source.close();
+        if (interval) clearInterval(interval);
       };
     }
   }, [currentEmail?.id, autoRefresh]);